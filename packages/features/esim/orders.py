@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-import uuid
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -33,7 +33,7 @@ def _save(items: List[Dict[str, Any]]) -> None:
 
 
 def _new_id() -> str:
-    return "esim_" + uuid.uuid4().hex[:12]
+    return "esim_" + os.urandom(6).hex()
 
 
 def now_iso() -> str:
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-import json
-import uuid
+import os
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from packages.utils.common import atomic_write, json_dumps, json_loads
+
 ROOT_DIR = Path(__file__).resolve().parents[3]
 DATA_DIR = ROOT_DIR / "data"
 SUBS_PATH = DATA_DIR / "subscriptions.json"
@@ -44,16 +45,17 @@ ADDONS_DEFAULT = {
 
 
 def _normalize_addons(raw: Any) -> Dict[str, Dict[str, Any]]:
-    out: Dict[str, Dict[str, Any]] = {}
-    raw_dict = raw if isinstance(raw, dict) else {}
-    for key, base in ADDONS_DEFAULT.items():
-        merged = dict(base)
-        if isinstance(raw_dict.get(key), dict):
-            merged.update(raw_dict.get(key))
-        out[key] = merged
-    for key, val in raw_dict.items():
-        if key not in out and isinstance(val, dict):
+    out: Dict[str, Dict[str, Any]] = {key: dict(base) for key, base in ADDONS_DEFAULT.items()}
+    if not raw or not isinstance(raw, dict):
+        return out
+    for key, val in raw.items():
+        if not isinstance(val, dict):
+            continue
+        merged = out.get(key)
+        if merged is None:
             out[key] = dict(val)
+        else:
+            merged.update(val)
     return out
 
 
@@ -61,8 +63,8 @@ def load_addons() -> Dict[str, Dict[str, Any]]:
     try:
         if not ADDONS_PATH.exists():
             return _normalize_addons({})
-        raw = ADDONS_PATH.read_text(encoding="utf-8")
-        data = json.loads(raw) if raw.strip() else {}
+        raw = ADDONS_PATH.read_bytes()
+        data = json_loads(raw) if raw.strip() else {}
         return _normalize_addons(data)
     except Exception:
         return _normalize_addons({})
@@ -71,7 +73,7 @@ def load_addons() -> Dict[str, Dict[str, Any]]:
 def save_addons(addons: Dict[str, Dict[str, Any]]) -> None:
     try:
         DATA_DIR.mkdir(parents=True, exist_ok=True)
-        ADDONS_PATH.write_text(json.dumps(addons, ensure_ascii=False, indent=2), encoding="utf-8")
+        atomic_write(ADDONS_PATH, json_dumps(addons, indent=True))
     except Exception:
         pass
 
@@ -85,23 +87,58 @@ def _ensure_file() -> None:
         SUBS_PATH.write_text("[]", encoding="utf-8")
 
 
+# Parsed subscriptions.json, reused while the file's (mtime, size) is unchanged.
+# Callers mutate the returned list in place and persist it through _save().
+_SUBS_CACHE: Dict[str, Any] = {"stamp": None, "data": None}
+
+
+def _file_stamp() -> Tuple[int, int]:
+    st = SUBS_PATH.stat()
+    return st.st_mtime_ns, st.st_size
+
+
 def _load() -> List[Dict[str, Any]]:
     try:
         _ensure_file()
-        raw = SUBS_PATH.read_text(encoding="utf-8")
-        data = json.loads(raw) if raw.strip() else []
-        return data if isinstance(data, list) else []
+        stamp = _file_stamp()
+        if _SUBS_CACHE["data"] is not None and _SUBS_CACHE["stamp"] == stamp:
+            return _SUBS_CACHE["data"]
+        raw = SUBS_PATH.read_bytes()
+        data = json_loads(raw) if raw.strip() else []
+        data = data if isinstance(data, list) else []
+        _SUBS_CACHE["stamp"] = stamp
+        _SUBS_CACHE["data"] = data
+        return data
     except Exception:
         return []
 
 
 def _save(data: List[Dict[str, Any]]) -> None:
     _ensure_file()
-    SUBS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    try:
+        atomic_write(SUBS_PATH, json_dumps(data))
+    except Exception:
+        # Drop the cache so unsaved in-place edits are not served on the next read.
+        _SUBS_CACHE["stamp"] = None
+        _SUBS_CACHE["data"] = None
+        raise
+    _SUBS_CACHE["stamp"] = _file_stamp()
+    _SUBS_CACHE["data"] = data
 
 
 def _new_id() -> str:
-    return f"sub_{uuid.uuid4().hex[:12]}"
+    return "sub_" + os.urandom(6).hex()
+
+
+_STATUS_ACTIVE = "active"
+_PERIODS = ("monthly", "yearly")
+
+
+def _norm_period(period: Any) -> str:
+    # Canonical values (the common case) skip the strip/lower allocations.
+    if period in _PERIODS:
+        return period
+    return str(period or "").strip().lower()
 
 
 def now_iso() -> str:
@@ -122,7 +159,8 @@ def parse_iso(dt: str) -> Optional[datetime]:
 
 def is_active(sub: Dict[str, Any], at: Optional[datetime] = None) -> bool:
     at = at or datetime.utcnow()
-    if str(sub.get("status") or "").lower() != "active":
+    status = sub.get("status")
+    if status != _STATUS_ACTIVE and str(status or "").lower() != _STATUS_ACTIVE:
         return False
     end = parse_iso(str(sub.get("end_at") or ""))
     if not end:
@@ -131,7 +169,7 @@ def is_active(sub: Dict[str, Any], at: Optional[datetime] = None) -> bool:
 
 
 def compute_period_dates(period: str, start_at: Optional[datetime] = None) -> Tuple[datetime, datetime]:
-    period = str(period or "").strip().lower()
+    period = _norm_period(period)
     start = start_at or datetime.utcnow()
     if period == "yearly":
         end = start + timedelta(days=365)
@@ -168,17 +206,22 @@ def grant_subscription_free(
     granted_by_user_id: str,
 ) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
     addon = str(addon or "").strip()
-    period = str(period or "").strip().lower()
+    period = _norm_period(period)
 
     if addon not in ADDONS:
         return False, "Unknown add-on.", None
-    if period not in ("monthly", "yearly"):
+    if period not in _PERIODS:
         return False, "Invalid period.", None
 
+    owner_str = owner_user_id if isinstance(owner_user_id, str) else str(owner_user_id)
     subs = _load()
     active_sub = next(
-        (s for s in subs if str(s.get("owner_user_id") or "") == str(owner_user_id)
-         and str(s.get("addon") or "") == addon and is_active(s)),
+        (
+            s for s in subs
+            if (v if isinstance(v := s.get("owner_user_id"), str) else str(v or "")) == owner_str
+            and (a if isinstance(a := s.get("addon"), str) else str(a or "")) == addon
+            and is_active(s)
+        ),
         None,
     )
     if active_sub:
@@ -193,7 +236,7 @@ def grant_subscription_free(
         "period": period,
         "price": 0,
         "currency": ADDONS[addon]["currency"],
-        "status": "active",
+        "status": _STATUS_ACTIVE,
         "start_at": start.isoformat() + "Z",
         "end_at": end.isoformat() + "Z",
         "recurring": False,
@@ -211,8 +254,12 @@ def grant_subscription_free(
 
 
 def list_subscriptions_for_owner(owner_user_id: str) -> List[Dict[str, Any]]:
+    owner_str = owner_user_id if isinstance(owner_user_id, str) else str(owner_user_id)
     subs = _load()
-    out = [s for s in subs if str(s.get("owner_user_id") or "") == str(owner_user_id)]
+    out = [
+        s for s in subs
+        if (v if isinstance(v := s.get("owner_user_id"), str) else str(v or "")) == owner_str
+    ]
     out.sort(key=lambda x: str(x.get("created_at") or ""), reverse=True)
     return out
 
@@ -224,26 +271,35 @@ def list_active_addons_for_user(user_id: str, owner_user_id: Optional[str] = Non
       - OR assigned to the user by their company admin owner (assigned_user_ids)
     If owner_user_id is provided, we also consider that owner's subscriptions.
     """
+    user_str = user_id if isinstance(user_id, str) else str(user_id)
+    owner_filter = str(owner_user_id) if owner_user_id else ""
     subs = _load()
     active: List[str] = []
     for s in subs:
-        addon = str(s.get("addon") or "")
+        addon = s.get("addon")
+        if not isinstance(addon, str):
+            addon = str(addon or "")
         if not addon:
             continue
         if not is_active(s):
             continue
 
-        owner = str(s.get("owner_user_id") or "")
-        assigned = s.get("assigned_user_ids") or []
-        assigned = [str(x) for x in assigned] if isinstance(assigned, list) else []
-
-        if owner_user_id:
-            if owner != str(owner_user_id):
-                continue
+        owner = s.get("owner_user_id")
+        if not isinstance(owner, str):
+            owner = str(owner or "")
+        if owner_filter and owner != owner_filter:
+            continue
         # active for:
         # - owner
         # - assigned users
-        if owner == str(user_id) or str(user_id) in assigned:
+        if owner == user_str:
+            if addon not in active:
+                active.append(addon)
+            continue
+        assigned = s.get("assigned_user_ids") or []
+        if not isinstance(assigned, list):
+            continue
+        if any((x if isinstance(x, str) else str(x)) == user_str for x in assigned):
             if addon not in active:
                 active.append(addon)
     return active
@@ -257,11 +313,11 @@ def purchase_subscription(
     recurring: bool = False,
 ) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
     addon = str(addon or "").strip()
-    period = str(period or "").strip().lower()
+    period = _norm_period(period)
 
     if addon not in ADDONS:
         return False, "Unknown add-on.", None
-    if period not in ("monthly", "yearly"):
+    if period not in _PERIODS:
         return False, "Invalid period.", None
 
     start, end = compute_period_dates(period)
@@ -275,7 +331,7 @@ def purchase_subscription(
         "period": period,
         "price": price,
         "currency": ADDONS[addon]["currency"],
-        "status": "active",
+        "status": _STATUS_ACTIVE,
         "start_at": start.isoformat() + "Z",
         "end_at": end.isoformat() + "Z",
         "recurring": bool(recurring),
@@ -294,11 +350,14 @@ def purchase_subscription(
 
 
 def admin_update_subscription(sub_id: str, fields: Dict[str, Any]) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+    sub_id = sub_id if isinstance(sub_id, str) else str(sub_id)
     subs = _load()
-    sub = next((s for s in subs if str(s.get("id")) == str(sub_id)), None)
+    sub = next((s for s in subs if (v if isinstance(v := s.get("id"), str) else str(v)) == sub_id), None)
     if not sub:
         return False, "Subscription not found.", None
 
+    before = dict(sub)
+
     # allow: status, end_at, assigned_user_ids
     if "status" in fields:
         sub["status"] = str(fields.get("status") or "").strip().lower() or sub.get("status")
@@ -313,20 +372,26 @@ def admin_update_subscription(sub_id: str, fields: Dict[str, Any]) -> Tuple[bool
     if "recurring_stopped_at" in fields:
         sub["recurring_stopped_at"] = str(fields.get("recurring_stopped_at") or "").strip()
 
+    if sub == before:
+        return True, "Updated.", sub
     sub["updated_at"] = now_iso()
     _save(subs)
     return True, "Updated.", sub
 
 
 def admin_delete_subscription(sub_id: str) -> bool:
+    sub_id = sub_id if isinstance(sub_id, str) else str(sub_id)
     subs = _load()
-    before = len(subs)
-    subs = [s for s in subs if str(s.get("id")) != str(sub_id)]
+    idx = next(
+        (i for i, s in enumerate(subs) if (v if isinstance(v := s.get("id"), str) else str(v)) == sub_id),
+        None,
+    )
+    if idx is None:
+        return False
+    del subs[idx]
     _save(subs)
-    return len(subs) != before
+    return True
 
 
 def list_all_subscriptions() -> List[Dict[str, Any]]:
-    subs = _load()
-    subs.sort(key=lambda x: str(x.get("created_at") or ""), reverse=True)
-    return subs
+    return sorted(_load(), key=lambda x: str(x.get("created_at") or ""), reverse=True)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); ALPN falls back to HTTP/1.1 otherwise.
+try:
+    import h2  # noqa: F401
+except ImportError:
+    HTTP2 = False
+else:
+    HTTP2 = True
+
+
+def json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def json_dumps(data: Any, indent: bool = False) -> bytes:
+    """Compact UTF-8 JSON by default; `indent=True` for the hand-editable config files."""
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=opts)
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Write the whole payload to a temp file, then swap it in so readers never see a partial file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
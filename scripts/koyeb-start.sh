@@ -4,9 +4,11 @@ set -euo pipefail
 # Run the internal backend on a fixed local port, and expose the frontend on $PORT.
 export AVAILABILITY_BACKEND_URL="${AVAILABILITY_BACKEND_URL:-http://127.0.0.1:5050}"
 
-uvicorn services.gateway.app:app --host 0.0.0.0 --port 5050 &
+# uvloop + httptools are pinned in requirements.txt. --loop/--http name them explicitly, so startup
+# fails if either is missing instead of silently falling back to the asyncio loop / h11 parser.
+uvicorn services.gateway.app:app --host 0.0.0.0 --port 5050 --loop uvloop --http httptools &
 GATEWAY_PID=$!
 
 trap 'kill ${GATEWAY_PID} 2>/dev/null || true' SIGINT SIGTERM
 
-uvicorn apps.web_flights.app:app --host 0.0.0.0 --port "${PORT:-8000}"
+uvicorn apps.web_flights.app:app --host 0.0.0.0 --port "${PORT:-8000}" --loop uvloop --http httptools
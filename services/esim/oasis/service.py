@@ -1,17 +1,51 @@
 from __future__ import annotations
 
-import json
+import atexit
 import os
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 import httpx
 
+from packages.utils.common import atomic_write, json_dumps, json_loads
+
 
 CONFIG_PATH = Path(__file__).resolve().parent / "config.json"
 DEFAULT_BASE_URL = "https://www.esimoasis.com/api/v1"
 
+# Short-lived cache of raw GET response bodies: key -> (expires_at, body).
+# Bodies are re-decoded on every hit so callers can mutate the result freely.
+_GET_CACHE: dict[tuple, tuple[float, bytes]] = {}
+_GET_CACHE_MAX = 512
+_GET_CACHE_LOCK = threading.Lock()
+CATALOG_CACHE_TTL_SEC = 60
+BALANCE_CACHE_TTL_SEC = 15
+
+# Bytes of config.json as last read or written, used to skip no-op rewrites.
+_CONFIG_BYTES: bytes | None = None
+
+# Shared client so repeated calls reuse pooled keep-alive connections.
+_CLIENT: httpx.Client | None = None
+
+
+def _get_client() -> httpx.Client:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.Client(
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        )
+    return _CLIENT
+
+
+@atexit.register
+def _close_client() -> None:
+    if _CLIENT is not None:
+        _CLIENT.close()
+
 
 def _now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
@@ -42,13 +76,20 @@ def _normalize_account(raw: Dict[str, Any]) -> Dict[str, str]:
     }
 
 
+POPULAR_DESTINATIONS_MAX = 16
+
+
 def _normalize_popular_destinations(raw: Any) -> list[dict]:
-    raw_list = raw if isinstance(raw, list) else []
+    if not isinstance(raw, list):
+        return []
     out: list[dict] = []
-    for item in raw_list:
+    for item in raw:
         if not isinstance(item, dict):
             continue
-        name = str(item.get("name") or "").strip()
+        name = item.get("name")
+        if not isinstance(name, str):
+            name = str(name or "")
+        name = name.strip()
         if not name:
             continue
         iso = str(item.get("iso") or "").strip().upper()
@@ -60,7 +101,7 @@ def _normalize_popular_destinations(raw: Any) -> list[dict]:
                 "initials": initials,
             }
         )
-        if len(out) >= 16:
+        if len(out) == POPULAR_DESTINATIONS_MAX:
             break
     return out
 
@@ -92,9 +133,12 @@ def _normalize_settings(raw: Any) -> dict:
 
 
 def load_config() -> dict:
+    global _CONFIG_BYTES
     try:
         if CONFIG_PATH.exists():
-            data = json.loads(CONFIG_PATH.read_text(encoding="utf-8") or "{}")
+            raw = CONFIG_PATH.read_bytes()
+            _CONFIG_BYTES = raw
+            data = json_loads(raw or b"{}")
             if isinstance(data, dict):
                 accounts = data.get("accounts")
                 if not isinstance(accounts, list):
@@ -112,6 +156,7 @@ def load_config() -> dict:
 
 
 def save_config(cfg: dict) -> dict:
+    global _CONFIG_BYTES
     if not isinstance(cfg, dict):
         cfg = {}
     existing = load_config()
@@ -169,7 +214,11 @@ def save_config(cfg: dict) -> dict:
         cfg.pop("fx_updated_by_id", None)
 
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    CONFIG_PATH.write_text(json.dumps(cfg, indent=2, ensure_ascii=False), encoding="utf-8")
+    new_bytes = json_dumps(cfg, indent=True)
+    if new_bytes == _CONFIG_BYTES:
+        return cfg
+    atomic_write(CONFIG_PATH, new_bytes)
+    _CONFIG_BYTES = new_bytes
     return cfg
 
 
@@ -210,11 +259,27 @@ def _request(
     params: Optional[Dict[str, Any]] = None,
     payload: Optional[Dict[str, Any]] = None,
     idempotency_key: str | None = None,
+    cache_ttl: float = 0,
 ) -> dict:
     account = _get_active_account()
     base_url = (account.get("base_url") or DEFAULT_BASE_URL).strip() or DEFAULT_BASE_URL
     url = base_url.rstrip("/") + "/" + path.lstrip("/")
 
+    cache_key = None
+    if cache_ttl > 0 and method.upper() == "GET":
+        cache_key = (
+            account.get("key_id"),
+            url,
+            tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())),
+        )
+        with _GET_CACHE_LOCK:
+            hit = _GET_CACHE.get(cache_key)
+        if hit and hit[0] > time.monotonic():
+            try:
+                return json_loads(hit[1])
+            except Exception:
+                pass
+
     headers = {
         "Authorization": f"Bearer {account.get('key_id')}:{account.get('secret')}",
         "Accept": "application/json",
@@ -222,38 +287,57 @@ def _request(
     if idempotency_key:
         headers["Idempotency-Key"] = idempotency_key
 
-    resp = httpx.request(
+    resp = _get_client().request(
         method.upper(),
         url,
         params=params or None,
         json=payload if payload is not None else None,
         headers=headers,
-        timeout=30,
     )
 
     if resp.status_code >= 400:
         raise ValueError(f"eSIM Oasis request failed ({resp.status_code}): {resp.text}")
 
     try:
-        return resp.json()
+        data = json_loads(resp.content)
     except Exception:
         return {"raw": resp.text}
 
+    if cache_key is not None:
+        now = time.monotonic()
+        with _GET_CACHE_LOCK:
+            if len(_GET_CACHE) >= _GET_CACHE_MAX:
+                for k in [k for k, (exp, _) in _GET_CACHE.items() if exp <= now]:
+                    _GET_CACHE.pop(k, None)
+                if len(_GET_CACHE) >= _GET_CACHE_MAX:
+                    _GET_CACHE.pop(next(iter(_GET_CACHE)), None)
+            _GET_CACHE[cache_key] = (now + cache_ttl, resp.content)
+    return data
+
 
 def ping() -> dict:
     return _request("GET", "/ping")
 
 
 def list_bundles(params: Optional[Dict[str, Any]] = None) -> dict:
-    return _request("GET", "/catalog", params=params)
+    return _request("GET", "/catalog", params=params, cache_ttl=CATALOG_CACHE_TTL_SEC)
 
 
 def quote(payload: Dict[str, Any]) -> dict:
     return _request("POST", "/quote", payload=payload)
 
 
+def _invalidate_balance_cache() -> None:
+    with _GET_CACHE_LOCK:
+        for k in [k for k in _GET_CACHE if k[1].endswith("/balance")]:
+            _GET_CACHE.pop(k, None)
+
+
 def create_order(payload: Dict[str, Any], idempotency_key: str | None = None) -> dict:
-    return _request("POST", "/orders", payload=payload, idempotency_key=idempotency_key)
+    data = _request("POST", "/orders", payload=payload, idempotency_key=idempotency_key)
+    # The order debits the account; don't serve the pre-order balance for the rest of its TTL.
+    _invalidate_balance_cache()
+    return data
 
 
 def get_order(order_id: str) -> dict:
@@ -265,4 +349,4 @@ def list_orders(params: Optional[Dict[str, Any]] = None) -> dict:
 
 
 def balance() -> dict:
-    return _request("GET", "/balance")
+    return _request("GET", "/balance", cache_ttl=BALANCE_CACHE_TTL_SEC)
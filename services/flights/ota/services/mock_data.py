@@ -4,6 +4,9 @@ from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 import random
 
+# (departure hour offset, arrival hour offset, price) for each demo result.
+_DEMO_SLOTS = tuple((6 + i * 2, 7 + i * 2, 105040.0 + i * 25000.0) for i in range(8))
+
 
 def generate_search_results(
     from_code: str,
@@ -55,13 +58,25 @@ def generate_search_results(
             "ticketing": {"companyShortName": airline, "code": "", "codeContext": "DEMO"},
         }
 
-    base = datetime.strptime(date, "%Y-%m-%d")
-    results = []
-    for i in range(8):
-        dep_dt = (base + timedelta(hours=6 + i * 2)).strftime("%Y-%m-%dT%H:%M:00.000+0300")
-        arr_dt = (base + timedelta(hours=7 + i * 2)).strftime("%Y-%m-%dT%H:%M:00.000+0300")
-        price = 105040.0 + i * 25000.0
-        results.append(mk(from_code, to_code, dep_dt, arr_dt, "IA", f"{900+i}", price))
+    def fmt(dt: datetime) -> str:
+        return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:00.000+0300"
+
+    try:
+        base = datetime.fromisoformat(date)
+    except ValueError:  # non-padded dates like "2025-3-5"
+        base = datetime.strptime(date, "%Y-%m-%d")
+    results = [
+        mk(
+            from_code,
+            to_code,
+            fmt(base + timedelta(hours=dep_h)),
+            fmt(base + timedelta(hours=arr_h)),
+            "IA",
+            f"{900+i}",
+            price,
+        )
+        for i, (dep_h, arr_h, price) in enumerate(_DEMO_SLOTS)
+    ]
 
     out = {"meta": {"echoToken": "DEMO", "targetName": "DEMO"}, "results_outbound": results}
     if trip_type == "roundtrip":
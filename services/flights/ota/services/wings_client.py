@@ -1,9 +1,32 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from typing import Any, Dict, Optional
 import httpx
 
+from packages.utils.common import HTTP2, json_dumps, json_loads
+
+# One pooled client shared by every WingsClient so searches/bookings reuse keep-alive connections.
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        )
+    return _HTTP_CLIENT
+
+
+async def aclose_http_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
 
 class WingsClient:
     def __init__(self, base_url: str, token: str, timeout_s: float = 45.0) -> None:
@@ -11,31 +34,37 @@ class WingsClient:
         self.token = token
         self.timeout = timeout_s
 
-    async def air_low_fare_search(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    # `http` is the caller's shared AsyncClient (the gateway's app.state.http); without one the
+    # module-level client is used.
+    async def air_low_fare_search(
+        self, payload: Dict[str, Any], http: httpx.AsyncClient | None = None
+    ) -> Dict[str, Any]:
         url = f"{self.base_url}/AirLowFareSearch"
         headers = {
             "Authorization": self.token,
             "Accept": "application/json",
             "Content-Type": "application/json",
         }
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            r = await client.post(url, headers=headers, json=payload)
-            r.raise_for_status()
-            return r.json()
+        # Search responses are large nested JSON; decode the raw bytes directly (orjson when available).
+        r = await (http or _get_http_client()).post(url, headers=headers, content=json_dumps(payload), timeout=self.timeout)
+        r.raise_for_status()
+        return json_loads(r.content)
 
-    async def air_book(self, xml_body: str) -> str:
+    async def air_book(self, xml_body: str | bytes, http: httpx.AsyncClient | None = None) -> str:
         url = f"{self.base_url}/AirBook"
         headers = {
             "Authorization": self.token,
             "Accept": "application/xml",
             "Content-Type": "application/xml",
         }
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            r = await client.post(url, headers=headers, content=xml_body.encode("utf-8"))
-            r.raise_for_status()
-            return r.text
+        # Callers that already hold UTF-8 bytes skip the re-encode.
+        body = xml_body if isinstance(xml_body, bytes) else xml_body.encode("utf-8")
+        r = await (http or _get_http_client()).post(url, headers=headers, content=body, timeout=self.timeout)
+        r.raise_for_status()
+        return r.text
 
 
+@lru_cache(maxsize=16)
 def _derive_base_from_full_url(url: str) -> str:
     u = (url or "").strip()
     if not u:
@@ -47,9 +76,12 @@ def _derive_base_from_full_url(url: str) -> str:
     return u
 
 
+@lru_cache(maxsize=1)
 def get_client_from_env() -> Optional[WingsClient]:
     """Create a WingsClient from environment variables.
 
+    The result is cached for the life of the process (env vars don't change at runtime).
+
     Supported env var names (for backwards compatibility with your .env.example and README):
       - Token: WINGS_AUTH_TOKEN or AUTH_TOKEN
       - Base:  WINGS_BASE_URL or derived from SEARCH_URL/BOOK_URL
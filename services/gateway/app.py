@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -11,8 +12,11 @@ load_dotenv(dotenv_path=Path(__file__).resolve().parents[2] / ".env")
 
 from fastapi import FastAPI
 
-from services.flights.ota.services.wings_client import get_client_from_env
+from services.flights.ota.services.wings_client import aclose_http_client, get_client_from_env
 from services.gateway.flights_utils import _wings_config_missing
+from services.gateway.health_interceptor import HealthCheckInterceptor
+from services.gateway.http_client import aclose_fallback_http_client, create_http_client
+from services.gateway.responses import FastJSONResponse
 from services.gateway.routers import (
     esim_router,
     flights_router,
@@ -20,44 +24,74 @@ from services.gateway.routers import (
     payments_router,
     permissions_router,
 )
+from services.payments.fib.service import aclose_http_client as aclose_fib_http_client
 
 BUILD_ID = "backend-live-wings-fix-v2"
 
-app = FastAPI(title="The Book Backend (API only)", version="1.0.0")
+# Resolved once at startup; env-based WINGS config doesn't change while running.
+_WINGS_CONFIGURED = False
+
+# Pre-encoded probe responses served by HealthCheckInterceptor (filled at startup).
+_PROBE_BODIES: dict[str, bytes] = {}
+
+fastapi_app = FastAPI(
+    title="The Book Backend (API only)",
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+)
 
 # Routers
-app.include_router(notifications_router)
-app.include_router(permissions_router)
-app.include_router(flights_router)
-app.include_router(payments_router)
-app.include_router(esim_router)
+fastapi_app.include_router(notifications_router)
+fastapi_app.include_router(permissions_router)
+fastapi_app.include_router(flights_router)
+fastapi_app.include_router(payments_router)
+fastapi_app.include_router(esim_router)
 
 
-@app.on_event("startup")
+@fastapi_app.on_event("startup")
 async def _startup_check():
+    global _WINGS_CONFIGURED
+    # Shared outbound client for all routers (see services.gateway.http_client.get_http).
+    fastapi_app.state.http = create_http_client()
     # Fail fast (so you don’t get “mystery 500” later)
     client = get_client_from_env()
-    if not client or _wings_config_missing():
+    _WINGS_CONFIGURED = bool(client) and not _wings_config_missing()
+    if not _WINGS_CONFIGURED:
         # We don't crash the server hard; we just make it explicit in logs/health.
         # But you can change this to raise RuntimeError(...) if you prefer hard-fail.
         print(
             "WARNING: WINGS credentials not configured. "
             "Set WINGS_AUTH_TOKEN (or AUTH_TOKEN) and optionally WINGS_BASE_URL/SEARCH_URL/BOOK_URL."
         )
+    _PROBE_BODIES["/__build"] = json.dumps(await build(), separators=(",", ":")).encode("utf-8")
+    _PROBE_BODIES["/health"] = json.dumps(await health(), separators=(",", ":")).encode("utf-8")
+
 
+@fastapi_app.on_event("shutdown")
+async def _shutdown():
+    http = getattr(fastapi_app.state, "http", None)
+    if http is not None:
+        await http.aclose()
+    await aclose_fallback_http_client()
+    await aclose_http_client()
+    await aclose_fib_http_client()
 
-@app.get("/__build")
+
+@fastapi_app.get("/__build")
 async def build():
     return {"build": BUILD_ID, "mode": "wings"}
 
 
-@app.get("/health")
+@fastapi_app.get("/health")
 async def health():
-    client = get_client_from_env()
-    ok = bool(client) and not _wings_config_missing()
+    ok = _WINGS_CONFIGURED
     return {
         "ok": ok,
         "build": BUILD_ID,
         "mode": "wings",
         "wings_configured": ok,
     }
+
+
+# Probes (/health, /__build) are answered before the FastAPI stack.
+app = HealthCheckInterceptor(fastapi_app, _PROBE_BODIES)
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from pathlib import Path
 
 
+@lru_cache(maxsize=1)
 def _wings_config_missing() -> bool:
     """
     Match the expectations of services.flights.ota.services.wings_client.get_client_from_env().
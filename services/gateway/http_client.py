@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import httpx
+from fastapi import Request
+
+from packages.utils.common import HTTP2
+
+def create_http_client() -> httpx.AsyncClient:
+    """The gateway's outbound client (WINGS, FIB). Created at startup and stored on app.state.http.
+
+    Pools are per host, so this doesn't merge WINGS and FIB connections; it gives all routers one
+    set of limits and one lifecycle tied to the app. Callers pass their own per-request timeouts.
+    """
+    return httpx.AsyncClient(
+        http2=HTTP2,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=200),
+    )
+
+
+# Used when the app's startup hook hasn't run (e.g. routers mounted on another app, or tests
+# that skip lifespan events); created on first use and closed by aclose_fallback_http_client().
+_FALLBACK_CLIENT: httpx.AsyncClient | None = None
+
+
+def get_http(request: Request) -> httpx.AsyncClient:
+    """FastAPI dependency returning the app's shared client (or a module-level fallback)."""
+    http = getattr(request.app.state, "http", None)
+    if http is not None and not http.is_closed:
+        return http
+
+    global _FALLBACK_CLIENT
+    if _FALLBACK_CLIENT is None or _FALLBACK_CLIENT.is_closed:
+        _FALLBACK_CLIENT = create_http_client()
+    return _FALLBACK_CLIENT
+
+
+async def aclose_fallback_http_client() -> None:
+    global _FALLBACK_CLIENT
+    if _FALLBACK_CLIENT is not None:
+        await _FALLBACK_CLIENT.aclose()
+        _FALLBACK_CLIENT = None
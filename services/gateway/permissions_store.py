@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import copy
 import json
+import threading
+from dataclasses import dataclass
 from datetime import datetime, time, timedelta
 from pathlib import Path
+from time import monotonic
+from typing import Dict, FrozenSet, Tuple
 from zoneinfo import ZoneInfo
 
+from packages.utils.common import atomic_write, json_dumps, json_loads
+
 
 # ------------------------------------------------------------
 # Provider permissions / filters / schedules (simple JSON store)
@@ -39,23 +46,70 @@ DEFAULT_PERMISSIONS = {
 }
 
 
+# Saves run on worker threads; one at a time, each replacing permissions.json atomically.
+_SAVE_LOCK = threading.Lock()
+
+# Parsed permissions.json, reused while the file's (mtime, size) is unchanged.
+_PERMISSIONS_CACHE: dict = {"stamp": None, "data": None}
+
+
 def _load_permissions() -> dict:
     """Load permissions config from disk.
 
+    The parsed config is cached until the file changes; treat the returned dict as read-only.
     Note: Providers can be removed by admins. If a provider is missing, it is treated as disabled.
     """
     try:
-        if PERMISSIONS_PATH.exists():
-            data = json.loads(PERMISSIONS_PATH.read_text(encoding="utf-8") or "{}")
-            if isinstance(data, dict):
-                providers = data.get("providers")
-                if not isinstance(providers, dict):
-                    data["providers"] = {}
-                return data
+        st = PERMISSIONS_PATH.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        if _PERMISSIONS_CACHE["data"] is not None and _PERMISSIONS_CACHE["stamp"] == stamp:
+            return _PERMISSIONS_CACHE["data"]
+        data = json_loads(PERMISSIONS_PATH.read_bytes() or b"{}")
+        if isinstance(data, dict):
+            providers = data.get("providers")
+            if not isinstance(providers, dict):
+                data["providers"] = {}
+            _PERMISSIONS_CACHE["stamp"] = stamp
+            _PERMISSIONS_CACHE["data"] = data
+            return data
     except Exception:
         pass
     # default
-    return json.loads(json.dumps(DEFAULT_PERMISSIONS))
+    return copy.deepcopy(DEFAULT_PERMISSIONS)
+
+
+# Provider codes that list themselves in blocked_suppliers, paired with the permissions dict
+# they were derived from. _load_permissions returns the same dict until the file changes.
+_SELF_BLOCKED_CACHE: dict = {"entry": None}
+
+
+def _self_blocked_providers(cfg: dict) -> FrozenSet[str]:
+    """Codes of providers whose own blocked_suppliers contains them (so availability is off)."""
+    entry = _SELF_BLOCKED_CACHE["entry"]
+    if entry is not None and entry[0] is cfg:
+        return entry[1]
+    blocked = set()
+    for code, p in (cfg.get("providers") or {}).items():
+        if not isinstance(p, dict):
+            continue
+        code = str(code)
+        if code in {str(x).strip() for x in p.get("blocked_suppliers") or []}:
+            blocked.add(code)
+    value = frozenset(blocked)
+    _SELF_BLOCKED_CACHE["entry"] = (cfg, value)
+    return value
+
+
+def _normalize_days(days) -> list[int]:
+    """Coerce a rule's days (list, or JSON string of a list) to ints; drop anything else."""
+    if isinstance(days, str):
+        try:
+            days = json.loads(days)
+        except Exception:
+            return []
+    if not isinstance(days, list):
+        return []
+    return [int(x) for x in days if isinstance(x, int) or str(x).isdigit()]
 
 
 def _save_permissions(cfg: dict) -> dict:
@@ -65,7 +119,20 @@ def _save_permissions(cfg: dict) -> dict:
     providers = cfg.get("providers")
     if not isinstance(providers, dict):
         cfg["providers"] = {}
-    PERMISSIONS_PATH.write_text(json.dumps(cfg, indent=2, ensure_ascii=False), encoding="utf-8")
+    # Store schedule days as plain ints so the runtime path never has to coerce them.
+    for p in cfg["providers"].values():
+        schedule = p.get("ticketing_schedule") if isinstance(p, dict) else None
+        rules = schedule.get("rules") if isinstance(schedule, dict) else None
+        if isinstance(rules, list):
+            for r in rules:
+                if isinstance(r, dict) and "days" in r:
+                    r["days"] = _normalize_days(r.get("days"))
+    data = json_dumps(cfg, indent=True)
+    with _SAVE_LOCK:
+        atomic_write(PERMISSIONS_PATH, data)
+        _PERMISSIONS_CACHE["stamp"] = None
+        _PERMISSIONS_CACHE["data"] = None
+        _invalidate_policy_cache()
     return cfg
 
 
@@ -80,6 +147,95 @@ def _parse_hhmm(v: str) -> time | None:
         return None
 
 
+_DEFAULT_TZ_NAME = "Asia/Baghdad"
+_DEFAULT_TZ = ZoneInfo(_DEFAULT_TZ_NAME)
+_TZ_CACHE: Dict[str, ZoneInfo] = {_DEFAULT_TZ_NAME: _DEFAULT_TZ}
+
+
+def _get_tz(name: str) -> ZoneInfo:
+    """ZoneInfo lookup memoized by name; unknown names fall back to Asia/Baghdad."""
+    tz = _TZ_CACHE.get(name)
+    if tz is None:
+        try:
+            tz = ZoneInfo(name)
+        except Exception:
+            tz = _DEFAULT_TZ
+        _TZ_CACHE[name] = tz
+    return tz
+
+
+@dataclass(frozen=True)
+class _CompiledSchedule:
+    enabled: bool
+    tzname: str
+    tz: ZoneInfo
+    has_rules: bool  # "rules" is a non-empty list
+    # (weekdays, start, end) per usable rule, in config order
+    rules: Tuple[Tuple[FrozenSet[int], time, time], ...]
+
+
+# Compiled schedules keyed by id() of the source dict; the dict itself is kept alongside so
+# the entry can't be matched by a different object that later reuses the same id.
+_SCHEDULE_CACHE: Dict[int, Tuple[dict, _CompiledSchedule]] = {}
+_SCHEDULE_CACHE_MAX = 64
+
+
+def _compile_schedule(schedule: dict) -> _CompiledSchedule:
+    hit = _SCHEDULE_CACHE.get(id(schedule))
+    if hit is not None and hit[0] is schedule:
+        return hit[1]
+
+    tzname = (schedule.get("timezone") or _DEFAULT_TZ_NAME).strip() or _DEFAULT_TZ_NAME
+    tz = _get_tz(tzname)
+
+    raw_rules = schedule.get("rules") or []
+    if not isinstance(raw_rules, list):
+        raw_rules = []
+
+    rules = []
+    for r in raw_rules:
+        if not isinstance(r, dict):
+            continue
+        days = r.get("days") or []
+        if isinstance(days, list) and all(type(x) is int for x in days):
+            day_set = frozenset(days)
+        else:
+            # Hand-edited / legacy files; _save_permissions stores clean ints.
+            day_set = frozenset(_normalize_days(days))
+        st = _parse_hhmm(str(r.get("start") or ""))
+        en = _parse_hhmm(str(r.get("end") or ""))
+        if not st or not en:
+            continue
+        rules.append((day_set, st, en))
+
+    compiled = _CompiledSchedule(
+        enabled=bool(schedule.get("enabled")),
+        tzname=tzname,
+        tz=tz,
+        has_rules=bool(raw_rules),
+        rules=tuple(rules),
+    )
+    if len(_SCHEDULE_CACHE) >= _SCHEDULE_CACHE_MAX:
+        _SCHEDULE_CACHE.clear()
+    _SCHEDULE_CACHE[id(schedule)] = (schedule, compiled)
+    return compiled
+
+
+def _rules_allow(sched: _CompiledSchedule, now: datetime) -> bool:
+    wd = now.weekday()  # 0=Mon .. 6=Sun
+    tnow = now.time()
+    for days, st, en in sched.rules:
+        if wd not in days:
+            continue
+        # Normal range (e.g. 09:00-18:00)
+        if st <= en and st <= tnow <= en:
+            return True
+        # Overnight range (e.g. 22:00-02:00)
+        if st > en and (tnow >= st or tnow <= en):
+            return True
+    return False
+
+
 def _ticketing_schedule_allows(schedule: dict) -> bool:
     try:
         if not isinstance(schedule, dict):
@@ -87,45 +243,65 @@ def _ticketing_schedule_allows(schedule: dict) -> bool:
         if not schedule.get("enabled"):
             return True
 
-        tzname = (schedule.get("timezone") or "Asia/Baghdad").strip() or "Asia/Baghdad"
-        try:
-            tz = ZoneInfo(tzname)
-        except Exception:
-            tz = ZoneInfo("Asia/Baghdad")
-
-        now = datetime.now(tz)
-        wd = int(now.weekday())  # 0=Mon .. 6=Sun
-        rules = schedule.get("rules") or []
-        if not isinstance(rules, list) or not rules:
+        sched = _compile_schedule(schedule)
+        if not sched.has_rules:
             return False
+        return _rules_allow(sched, datetime.now(sched.tz))
+    except Exception:
+        return True
 
-        for r in rules:
-            if not isinstance(r, dict):
-                continue
-            days = r.get("days") or []
-            if isinstance(days, str):
-                try:
-                    days = json.loads(days)
-                except Exception:
-                    days = []
-            if wd not in set(int(x) for x in days if str(x).isdigit() or isinstance(x, int)):
-                continue
-            st = _parse_hhmm(str(r.get("start") or ""))
-            en = _parse_hhmm(str(r.get("end") or ""))
-            if not st or not en:
+
+def _schedule_windows(sched: _CompiledSchedule, now: datetime) -> dict:
+    tz = sched.tz
+    today = now.date()
+    windows = []
+    for days, st, en in sched.rules:
+        for offset in range(0, 8):
+            d = today + timedelta(days=offset)
+            if d.weekday() not in days:
                 continue
+            start_dt = datetime.combine(d, st, tzinfo=tz)
+            if en >= st:
+                end_dt = datetime.combine(d, en, tzinfo=tz)
+            else:
+                end_dt = datetime.combine(d + timedelta(days=1), en, tzinfo=tz)
+            windows.append((start_dt, end_dt))
+
+    windows.sort(key=lambda x: x[0])
+    current = None
+    next_win = None
+
+    for w in windows:
+        if w[0] <= now <= w[1]:
+            current = w
+            break
+
+    if current:
+        for w in windows:
+            if w[0] > current[1]:
+                next_win = w
+                break
+    else:
+        for w in windows:
+            if w[0] > now:
+                next_win = w
+                break
 
-            tnow = now.time()
-            # Normal range (e.g. 09:00-18:00)
-            if st <= en and st <= tnow <= en:
-                return True
-            # Overnight range (e.g. 22:00-02:00)
-            if st > en and (tnow >= st or tnow <= en):
-                return True
+    def _fmt(w):
+        if not w:
+            return None
+        return {
+            "start": w[0].isoformat(),
+            "end": w[1].isoformat(),
+        }
 
-        return False
-    except Exception:
-        return True
+    return {
+        "enabled": sched.enabled,
+        "timezone": sched.tzname,
+        "now": now.isoformat(),
+        "current_window": _fmt(current),
+        "next_window": _fmt(next_win),
+    }
 
 
 def _compute_schedule_windows(schedule: dict) -> dict:
@@ -133,85 +309,55 @@ def _compute_schedule_windows(schedule: dict) -> dict:
     try:
         if not isinstance(schedule, dict):
             return {"enabled": False}
-        enabled = bool(schedule.get("enabled"))
-        tzname = (schedule.get("timezone") or "Asia/Baghdad").strip() or "Asia/Baghdad"
-        try:
-            tz = ZoneInfo(tzname)
-        except Exception:
-            tz = ZoneInfo("Asia/Baghdad")
+        sched = _compile_schedule(schedule)
+        return _schedule_windows(sched, datetime.now(sched.tz))
+    except Exception:
+        return {"enabled": False}
 
-        now = datetime.now(tz)
-        rules = schedule.get("rules") or []
-        if not isinstance(rules, list):
-            rules = []
 
-        windows = []
-        for r in rules:
-            if not isinstance(r, dict):
-                continue
-            days = r.get("days") or []
-            if isinstance(days, str):
-                try:
-                    days = json.loads(days)
-                except Exception:
-                    days = []
-            days = [int(x) for x in days if str(x).isdigit() or isinstance(x, int)]
-            st = _parse_hhmm(str(r.get("start") or ""))
-            en = _parse_hhmm(str(r.get("end") or ""))
-            if not st or not en:
-                continue
+def _schedule_status(schedule: dict) -> Tuple[bool, dict]:
+    """(_ticketing_schedule_allows, _compute_schedule_windows) from one compile and one clock read."""
+    if not isinstance(schedule, dict):
+        return True, {"enabled": False}
+    try:
+        sched = _compile_schedule(schedule)
+        now = datetime.now(sched.tz)
+    except Exception:
+        return True, {"enabled": False}
+    try:
+        allows = not sched.enabled or (sched.has_rules and _rules_allow(sched, now))
+    except Exception:
+        allows = True
+    try:
+        windows = _schedule_windows(sched, now)
+    except Exception:
+        windows = {"enabled": False}
+    return allows, windows
 
-            for offset in range(0, 8):
-                d = (now.date() + timedelta(days=offset))
-                if int(d.weekday()) not in set(days):
-                    continue
-                start_dt = datetime.combine(d, st, tzinfo=tz)
-                if en >= st:
-                    end_dt = datetime.combine(d, en, tzinfo=tz)
-                else:
-                    end_dt = datetime.combine(d + timedelta(days=1), en, tzinfo=tz)
-                windows.append((start_dt, end_dt))
-
-        windows.sort(key=lambda x: x[0])
-        current = None
-        next_win = None
 
-        for w in windows:
-            if w[0] <= now <= w[1]:
-                current = w
-                break
+# Derived OTA policy, reused for a few seconds. The schedule check depends on the time of day,
+# so this can't be keyed on the file stamp alone. Saving permissions clears it immediately.
+_OTA_POLICY_TTL_SEC = 5.0
+_OTA_POLICY_CACHE: dict = {"ts": 0.0, "value": None}
 
-        if current:
-            for w in windows:
-                if w[0] > current[1]:
-                    next_win = w
-                    break
-        else:
-            for w in windows:
-                if w[0] > now:
-                    next_win = w
-                    break
-
-        def _fmt(w):
-            if not w:
-                return None
-            return {
-                "start": w[0].isoformat(),
-                "end": w[1].isoformat(),
-            }
 
-        return {
-            "enabled": enabled,
-            "timezone": tzname,
-            "now": now.isoformat(),
-            "current_window": _fmt(current),
-            "next_window": _fmt(next_win),
-        }
-    except Exception:
-        return {"enabled": False}
+def _invalidate_policy_cache() -> None:
+    _OTA_POLICY_CACHE["value"] = None
 
 
 def _ota_policy() -> dict:
+    """Effective OTA policy for the request path; treat the returned dict as read-only."""
+    now = monotonic()
+    cached = _OTA_POLICY_CACHE["value"]
+    if cached is not None and (now - _OTA_POLICY_CACHE["ts"]) < _OTA_POLICY_TTL_SEC:
+        return cached
+    value = _ota_policy_uncached()
+    _OTA_POLICY_CACHE["ts"] = now
+    _OTA_POLICY_CACHE["value"] = value
+    return value
+
+
+def _ota_policy_uncached() -> dict:
     cfg = _load_permissions()
     p = (cfg.get("providers") or {}).get("OTA")
     # If OTA is not present (deleted), treat as disabled.
@@ -223,6 +369,7 @@ def _ota_policy() -> dict:
             "ticketing_schedule_ok": False,
             "filters_enabled": True,
             "blocked_airlines": [],
+            "blocked_airlines_set": frozenset(),
         }
 
     availability = bool(p.get("availability_enabled", True))
@@ -243,4 +390,6 @@ def _ota_policy() -> dict:
         "ticketing_schedule_ok": ticketing_allowed_by_schedule,
         "filters_enabled": filters_enabled,
         "blocked_airlines": blocked_airlines,
+        # Membership-test form of blocked_airlines, built once per policy instead of per request.
+        "blocked_airlines_set": frozenset(blocked_airlines),
     }
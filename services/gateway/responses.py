@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+# JSON response class for the gateway: orjson-backed when orjson is installed,
+# otherwise Starlette's stdlib-json JSONResponse. Same constructor either way.
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+    from fastapi.responses import JSONResponse as FastJSONResponse
+else:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+
+# MessagePack is only offered when msgspec is installed.
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def json_encode(content: Any) -> bytes:
+    """Encode a payload the same way FastJSONResponse would."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _accept_match(accept: str, media_type: str) -> tuple[int, float]:
+    """(specificity, q) of the most specific Accept range matching `media_type`; (-1, 0.0) if none.
+
+    Specificity is 2 for an exact type, 1 for `type/*`, 0 for `*/*`.
+    """
+    wildcard = media_type.partition("/")[0] + "/*"
+    best = (-1, 0.0)
+    for part in accept.split(","):
+        media_range, *params = part.split(";")
+        media_range = media_range.strip().lower()
+        if media_range == media_type:
+            spec = 2
+        elif media_range == wildcard:
+            spec = 1
+        elif media_range == "*/*":
+            spec = 0
+        else:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if spec > best[0]:
+            best = (spec, q)
+    return best
+
+
+def wants_msgpack(accept: str | None) -> bool:
+    """True if the client prefers MessagePack to JSON and we are able to produce it.
+
+    Media ranges and q-values are honoured (`application/msgpack;q=0` refuses it); on a tie
+    MessagePack wins only when the client named it explicitly, so `*/*` still gets JSON.
+    """
+    if msgspec is None or not accept:
+        return False
+    spec, q = _accept_match(accept, MSGPACK_MEDIA_TYPE)
+    if q <= 0:
+        return False
+    json_q = _accept_match(accept, JSON_MEDIA_TYPE)[1]
+    return q > json_q or (q == json_q and spec == 2)
+
+
+def msgpack_encode(content: Any) -> bytes:
+    return msgspec.msgpack.encode(content)
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack_encode(content)
+
+
+__all__ = [
+    "FastJSONResponse",
+    "JSON_MEDIA_TYPE",
+    "MSGPACK_MEDIA_TYPE",
+    "MsgPackResponse",
+    "json_encode",
+    "msgpack_encode",
+    "wants_msgpack",
+]
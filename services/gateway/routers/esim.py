@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import json
 import time
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
 from starlette.concurrency import run_in_threadpool
 
 from services.esim.oasis.service import (
+    CONFIG_PATH as ESIM_CONFIG_PATH,
     balance as esim_balance,
     create_order as esim_create_order,
     get_order as esim_get_order,
@@ -17,37 +18,70 @@ from services.esim.oasis.service import (
     quote as esim_quote,
     save_config as save_esim_config,
 )
+from services.gateway.responses import (
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    json_encode,
+    msgpack_encode,
+    wants_msgpack,
+)
 
 router = APIRouter()
 
-_ESIM_BUNDLES_CACHE: dict[str, dict] = {}
+# Projected (filtered + priced) bundles, keyed by query params plus the settings that shape them.
+_ESIM_BUNDLES_CACHE: dict[tuple, dict] = {}
+# Raw upstream bundles, keyed by query params only, so a settings change re-projects without refetching.
+_ESIM_RAW_BUNDLES_CACHE: dict[tuple, dict] = {}
 _ESIM_BUNDLES_TTL_SEC = 300
+_ESIM_BUNDLES_MAX_ENTRIES = 256
 
+# Normalized settings, reused while the eSIM config file's (mtime, size) is unchanged.
+_ESIM_SETTINGS_CACHE: dict = {"stamp": None, "value": None}
 
-def _esim_cache_key(params: dict | None, settings: dict) -> str:
-    payload = {
-        "params": params or {},
-        "allowed": settings.get("allowed_countries") or [],
-        "fx_rate": settings.get("fx_rate") or 0,
-        "markup_percent": settings.get("markup_percent") or 0,
-        "markup_fixed_iqd": settings.get("markup_fixed_iqd") or 0,
-    }
-    return json.dumps(payload, sort_keys=True)
 
+def _esim_cache_key(param_key: tuple, settings: dict) -> tuple:
+    return (
+        param_key,
+        tuple(settings.get("allowed_countries") or ()),
+        settings.get("fx_rate") or 0,
+        settings.get("markup_percent") or 0,
+        settings.get("markup_fixed_iqd") or 0,
+    )
 
-def _esim_cache_get(key: str) -> dict | None:
-    item = _ESIM_BUNDLES_CACHE.get(key)
+
+def _esim_cache_get(key: tuple, cache: dict = _ESIM_BUNDLES_CACHE) -> dict | None:
+    """Return the live cache entry ({"ts", "value", "bodies"}) or None."""
+    item = cache.get(key)
     if not item:
         return None
     ts = float(item.get("ts") or 0)
-    if (time.time() - ts) > _ESIM_BUNDLES_TTL_SEC:
-        _ESIM_BUNDLES_CACHE.pop(key, None)
+    if (time.monotonic() - ts) > _ESIM_BUNDLES_TTL_SEC:
+        cache.pop(key, None)
         return None
-    return item.get("value")
+    return item
+
+
+def _esim_cache_set(key: tuple, value: dict, cache: dict = _ESIM_BUNDLES_CACHE) -> dict:
+    now = time.monotonic()
+    if key not in cache and len(cache) >= _ESIM_BUNDLES_MAX_ENTRIES:
+        # Drop expired entries first, then the oldest ones (dicts keep insertion order).
+        for k in [k for k, v in cache.items() if (now - v["ts"]) > _ESIM_BUNDLES_TTL_SEC]:
+            cache.pop(k, None)
+        while len(cache) >= _ESIM_BUNDLES_MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+    item = {"ts": now, "value": value, "bodies": {}}
+    cache[key] = item
+    return item
 
 
-def _esim_cache_set(key: str, value: dict) -> None:
-    _ESIM_BUNDLES_CACHE[key] = {"ts": time.time(), "value": value}
+def _esim_cached_response(item: dict, msgpack: bool) -> Response:
+    # Each representation is encoded once per cache entry, then served as raw bytes.
+    media_type = MSGPACK_MEDIA_TYPE if msgpack else JSON_MEDIA_TYPE
+    body = item["bodies"].get(media_type)
+    if body is None:
+        body = msgpack_encode(item["value"]) if msgpack else json_encode(item["value"])
+        item["bodies"][media_type] = body
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
 
 
 @router.get("/api/other-apis/esim")
@@ -73,6 +107,21 @@ async def esim_ping_endpoint():
 
 
 def _esim_settings() -> dict:
+    """Normalized eSIM settings (treat as read-only; cached until config.json changes)."""
+    try:
+        st = ESIM_CONFIG_PATH.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    if stamp is not None and _ESIM_SETTINGS_CACHE["stamp"] == stamp:
+        return _ESIM_SETTINGS_CACHE["value"]
+    settings = _esim_settings_uncached()
+    _ESIM_SETTINGS_CACHE["stamp"] = stamp
+    _ESIM_SETTINGS_CACHE["value"] = settings
+    return settings
+
+
+def _esim_settings_uncached() -> dict:
     cfg = load_esim_config()
     settings = cfg.get("settings") if isinstance(cfg.get("settings"), dict) else {}
     allowed = settings.get("allowed_countries")
@@ -102,51 +151,69 @@ def _esim_settings() -> dict:
     return settings
 
 
-def _esim_apply_country_filter(item: dict, allowed: list[str]) -> tuple[bool, dict]:
+def _esim_apply_country_filter(item: dict, allowed: frozenset[str]) -> tuple[bool, dict]:
+    """Return (keep, item) where item is a shallow copy limited to allowed countries.
+
+    The input dict is never mutated, so upstream responses can be cached and re-filtered.
+    """
     if not allowed:
         return True, item
     countries = item.get("countries") or []
     if not isinstance(countries, list):
         countries = []
-    filtered = []
-    for c in countries:
-        if not isinstance(c, dict):
-            continue
-        iso = str(c.get("iso") or "").strip().upper()
-        if iso and iso in allowed:
-            filtered.append(c)
+    filtered = [
+        c for c in countries
+        if isinstance(c, dict) and str(c.get("iso") or "").strip().upper() in allowed
+    ]
     if not filtered:
         return False, item
-    item["countries"] = filtered
-    return True, item
+    return True, {**item, "countries": filtered}
 
 
-def _esim_apply_pricing(item: dict, settings: dict) -> dict:
-    price = item.get("price") or {}
+def _esim_pricing_params(settings: dict) -> tuple[float, float, float, float] | None:
+    """Resolve (fx, markup_percent, markup_fixed_iqd, percent multiplier) once per request.
+
+    Returns None when no usable FX rate is configured (prices are then left in USD).
+    """
     try:
-        usd_minor = price.get("finalMinor")
-        if usd_minor is None:
-            return item
-        usd_minor = float(usd_minor)
         fx = float(settings.get("fx_rate") or 0)
         if fx <= 0:
-            return item
-        iqd = (usd_minor / 100.0) * fx
+            return None
         pct = float(settings.get("markup_percent") or 0)
-        if pct:
-            iqd = iqd * (1 + pct / 100.0)
         fixed = float(settings.get("markup_fixed_iqd") or 0)
-        if fixed:
-            iqd += fixed
-        iqd_final = int(round(iqd))
-        price["finalMinor"] = iqd_final
-        price["currency"] = "IQD"
-        item["price"] = price
-        item["price_usd_minor"] = int(usd_minor)
-        item["fx_rate"] = fx
-        item["markup_percent"] = pct
-        item["markup_fixed_iqd"] = fixed
+    except Exception:
+        return None
+    return fx, pct, fixed, 1 + pct / 100.0
+
+
+def _esim_to_iqd(usd_minor: float, pricing: tuple[float, float, float, float]) -> int:
+    fx, pct, fixed, pct_mult = pricing
+    iqd = (usd_minor / 100.0) * fx
+    if pct:
+        iqd = iqd * pct_mult
+    if fixed:
+        iqd += fixed
+    return int(round(iqd))
+
+
+def _esim_apply_pricing(item: dict, pricing: tuple[float, float, float, float] | None) -> dict:
+    """Return `item` priced in IQD. The input (and its price dict) is never modified."""
+    if pricing is None:
         return item
+    price = item.get("price") or {}
+    try:
+        usd_minor = price.get("finalMinor")
+        if usd_minor is None:
+            return item
+        usd_minor = float(usd_minor)
+        return {
+            **item,
+            "price": {**price, "finalMinor": _esim_to_iqd(usd_minor, pricing), "currency": "IQD"},
+            "price_usd_minor": int(usd_minor),
+            "fx_rate": pricing[0],
+            "markup_percent": pricing[1],
+            "markup_fixed_iqd": pricing[2],
+        }
     except Exception:
         return item
 
@@ -154,15 +221,25 @@ def _esim_apply_pricing(item: dict, settings: dict) -> dict:
 @router.get("/api/esim/bundles")
 async def esim_bundles(request: Request):
     try:
-        params = dict(request.query_params)
+        query = request.query_params
         settings = _esim_settings()
-        cache_key = _esim_cache_key(params, settings)
+        param_key = tuple(sorted(query.multi_items()))
+        cache_key = _esim_cache_key(param_key, settings)
+        msgpack = wants_msgpack(request.headers.get("accept"))
         cached = _esim_cache_get(cache_key)
-        if cached:
-            return cached
-
-        data = await run_in_threadpool(esim_list_bundles, params=params or None)
-        allowed = settings.get("allowed_countries") or []
+        if cached and cached.get("value"):
+            return _esim_cached_response(cached, msgpack)
+
+        raw = _esim_cache_get(param_key, _ESIM_RAW_BUNDLES_CACHE)
+        if raw and raw.get("value"):
+            raw_data = raw["value"]
+        else:
+            raw_data = await run_in_threadpool(esim_list_bundles, params=dict(query) if query else None)
+            _esim_cache_set(param_key, raw_data, _ESIM_RAW_BUNDLES_CACHE)
+        # Project onto a shallow copy; filter/pricing return new items, so raw_data stays pristine.
+        data = dict(raw_data)
+        allowed = frozenset(settings.get("allowed_countries") or ())
+        pricing = _esim_pricing_params(settings)
         items = data.get("items") or data.get("bundles") or []
         out_items = []
         for item in items:
@@ -171,13 +248,13 @@ async def esim_bundles(request: Request):
             ok, item = _esim_apply_country_filter(item, allowed)
             if not ok:
                 continue
-            item = _esim_apply_pricing(item, settings)
+            item = _esim_apply_pricing(item, pricing)
             out_items.append(item)
         data["items"] = out_items
         if "bundles" in data:
             data["bundles"] = out_items
-        _esim_cache_set(cache_key, data)
-        return data
+        entry = _esim_cache_set(cache_key, data)
+        return _esim_cached_response(entry, msgpack)
     except HTTPException:
         raise
     except Exception as e:
@@ -189,12 +266,12 @@ async def esim_quote_endpoint(payload: dict):
     try:
         data = esim_quote(payload or {})
         settings = _esim_settings()
-        allowed = settings.get("allowed_countries") or []
+        allowed = frozenset(settings.get("allowed_countries") or ())
         if isinstance(data, dict):
             ok, data = _esim_apply_country_filter(data, allowed)
             if not ok:
                 raise HTTPException(status_code=403, detail="Bundle not available for allowed countries.")
-            data = _esim_apply_pricing(data, settings)
+            data = _esim_apply_pricing(data, _esim_pricing_params(settings))
         return data
     except HTTPException:
         raise
@@ -220,12 +297,13 @@ async def esim_order_create(payload: dict):
 @router.get("/api/esim/orders")
 async def esim_orders_list(request: Request):
     try:
-        params = dict(request.query_params)
-        data = esim_list_orders(params=params or None)
-        settings = _esim_settings()
-        if isinstance(data, dict) and settings.get("fx_rate"):
+        query = request.query_params
+        data = esim_list_orders(params=dict(query) if query else None)
+        pricing = _esim_pricing_params(_esim_settings())
+        if isinstance(data, dict) and pricing is not None:
             items = data.get("items") or []
             out = []
+            to_iqd = _esim_to_iqd
             for item in items:
                 if not isinstance(item, dict):
                     continue
@@ -234,15 +312,7 @@ async def esim_orders_list(request: Request):
                 except Exception:
                     usd_minor = None
                 if usd_minor is not None:
-                    fx = float(settings.get("fx_rate") or 0)
-                    pct = float(settings.get("markup_percent") or 0)
-                    fixed = float(settings.get("markup_fixed_iqd") or 0)
-                    iqd = (usd_minor / 100.0) * fx
-                    if pct:
-                        iqd = iqd * (1 + pct / 100.0)
-                    if fixed:
-                        iqd += fixed
-                    item["total_iqd"] = int(round(iqd))
+                    item["total_iqd"] = to_iqd(usd_minor, pricing)
                 out.append(item)
             data["items"] = out
         return data
@@ -256,22 +326,14 @@ async def esim_orders_list(request: Request):
 async def esim_order_get(order_id: str):
     try:
         data = esim_get_order(order_id)
-        settings = _esim_settings()
-        if isinstance(data, dict) and settings.get("fx_rate"):
+        pricing = _esim_pricing_params(_esim_settings())
+        if isinstance(data, dict) and pricing is not None:
             try:
                 usd_minor = float(data.get("totalMinor"))
             except Exception:
                 usd_minor = None
             if usd_minor is not None:
-                fx = float(settings.get("fx_rate") or 0)
-                pct = float(settings.get("markup_percent") or 0)
-                fixed = float(settings.get("markup_fixed_iqd") or 0)
-                iqd = (usd_minor / 100.0) * fx
-                if pct:
-                    iqd = iqd * (1 + pct / 100.0)
-                if fixed:
-                    iqd += fixed
-                data["total_iqd"] = int(round(iqd))
+                data["total_iqd"] = _esim_to_iqd(usd_minor, pricing)
         return data
     except HTTPException:
         raise
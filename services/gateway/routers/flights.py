@@ -2,58 +2,93 @@ from __future__ import annotations
 
 import asyncio
 import json
+import logging
+import os
+import re
 import time
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from secrets import token_hex
+from typing import Optional, Union
+from uuid import uuid4
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape as _xml_escape
 
 import httpx
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, Json, field_validator
+from starlette.concurrency import run_in_threadpool
 
 from services.flights.ota.services.normalize import normalize_priced_itineraries
 from services.flights.ota.services.wings_client import get_client_from_env
 from services.gateway.flights_utils import _wings_config_missing
+from services.gateway.http_client import get_http
 from services.gateway.permissions_store import _ota_policy
+from services.gateway.responses import FastJSONResponse
+
+try:
+    from lxml import etree as _LET
+except ImportError:  # optional speedup; stdlib ElementTree is the fallback
+    _LET = None
+
+logger = logging.getLogger(__name__)
+
+# Handlers return FastJSONResponse instances directly, so FastAPI never runs jsonable_encoder /
+# response validation over the (large) result lists. Don't add response_model to these routes.
+router = APIRouter(default_response_class=FastJSONResponse)
+
+# Small in-memory cache to reduce repeated external API calls on the same search. Entries are
+# projected WINGS search results (normalized itineraries or the roundtrip price map), never the
+# raw multi-MB responses, keyed by projection and the exact payload sent. Oneway and roundtrip
+# searches share legs, so each distinct payload is fetched at most once per TTL; concurrent
+# identical searches wait on the one already in flight. Cached values are shared: don't mutate.
+_SEARCH_CACHE: dict[str, dict] = {}
+_SEARCH_INFLIGHT: dict[str, asyncio.Future] = {}
+_SEARCH_TTL_SEC = 45
+_SEARCH_MAX_ENTRIES = 64
+
+
+async def _cached_search(client, payload: dict, project, http: httpx.AsyncClient | None = None) -> dict:
+    """Search WINGS and cache `project(response)`; only the projection outlives the call."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    key = f"{project.__name__}|{client.base_url}|{body}"
+    item = _SEARCH_CACHE.get(key)
+    if item and (time.monotonic() - item["ts"]) <= _SEARCH_TTL_SEC:
+        return item["value"]
+
+    fut = _SEARCH_INFLIGHT.get(key)
+    if fut is not None:
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                raise
+            # The leading call was cancelled (e.g. a timed-out roundtrip search); search ourselves.
+
+    fut = asyncio.get_running_loop().create_future()
+    _SEARCH_INFLIGHT[key] = fut
+    try:
+        value = project(await client.air_low_fare_search(payload, http))
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved: nobody may be waiting on it
+        raise
+    finally:
+        if _SEARCH_INFLIGHT.get(key) is fut:
+            del _SEARCH_INFLIGHT[key]
 
-router = APIRouter()
-
-# Small in-memory cache to reduce repeated external API calls on the same search.
-_AVAIL_CACHE: dict[str, dict] = {}
-_AVAIL_TTL_SEC = 45
-
-
-def _avail_cache_key(req: "AvailabilityRequest", pol: dict) -> str:
-    blocked = pol.get("blocked_airlines") if isinstance(pol, dict) else []
-    if not isinstance(blocked, list):
-        blocked = []
-    filters_enabled = bool(pol.get("filters_enabled", True)) if isinstance(pol, dict) else True
-    payload = {
-        "from": req.from_,
-        "to": req.to,
-        "date": req.date,
-        "trip_type": req.trip_type,
-        "return_date": req.return_date,
-        "cabin": req.cabin,
-        "pax": {"adults": req.pax.adults, "children": req.pax.children, "infants": req.pax.infants},
-        "filters_enabled": filters_enabled,
-        "blocked_airlines": [str(x).upper() for x in blocked if str(x).strip()],
-    }
-    return json.dumps(payload, sort_keys=True)
-
-
-def _avail_cache_get(key: str) -> dict | None:
-    item = _AVAIL_CACHE.get(key)
-    if not item:
-        return None
-    ts = float(item.get("ts") or 0)
-    if (time.time() - ts) > _AVAIL_TTL_SEC:
-        _AVAIL_CACHE.pop(key, None)
-        return None
-    return item.get("value")
-
-
-def _avail_cache_set(key: str, value: dict) -> None:
-    _AVAIL_CACHE[key] = {"ts": time.time(), "value": value}
+    now = time.monotonic()
+    if key not in _SEARCH_CACHE and len(_SEARCH_CACHE) >= _SEARCH_MAX_ENTRIES:
+        for k in [k for k, v in _SEARCH_CACHE.items() if (now - v["ts"]) > _SEARCH_TTL_SEC]:
+            _SEARCH_CACHE.pop(k, None)
+        while len(_SEARCH_CACHE) >= _SEARCH_MAX_ENTRIES:
+            _SEARCH_CACHE.pop(next(iter(_SEARCH_CACHE)))
+    _SEARCH_CACHE[key] = {"ts": now, "value": value}
+    fut.set_result(value)
+    return value
 
 
 # ------------------------------------------------------------
@@ -91,6 +126,18 @@ class Passenger(BaseModel):
     doc_type: Optional[str] = None
 
 
+# Placeholder contact person when a booking arrives without passengers. Built once and
+# without validation: every field is a known-good constant.
+_FALLBACK_PASSENGER = Passenger.model_construct(
+    first_name="Test",
+    last_name="User",
+    birth_date="1990-01-01",
+    pax_type="ADT",
+    name_prefix="MR",
+    gender="M",
+)
+
+
 class Contact(BaseModel):
     phone: Optional[str] = None
     email: Optional[str] = None
@@ -98,17 +145,183 @@ class Contact(BaseModel):
     city: Optional[str] = None
 
 
+# Priced itineraries arrive as JSON strings (current UI) or as objects. Strings are decoded by
+# pydantic-core while the request body is validated, instead of a second json.loads pass.
+ItineraryJson = Union[dict, Json[dict]]
+
+
 class BookingRequest(BaseModel):
     trip_type: str = Field("oneway")
-    outbound_itinerary_json: str
-    return_itinerary_json: Optional[str] = None
+    outbound_itinerary_json: ItineraryJson
+    return_itinerary_json: Optional[ItineraryJson] = None
     passengers: list[Passenger] = Field(default_factory=list)
     contact: Optional[Contact] = None
 
+    @field_validator("return_itinerary_json", mode="before")
+    @classmethod
+    def _blank_return_is_none(cls, v):
+        # Oneway bookings may send "" (or {}) for the return leg.
+        return v or None
+
+
+# ------------------------------------------------------------
+# OTA_AirBookRQ templates (filled with str.format_map; values are escaped by the caller)
+# ------------------------------------------------------------
+_AIR_TRAVELER_TMPL = '''    <AirTraveler BirthDate="{birth_date}" PassengerTypeCode="{pax_type}" AccompaniedByInfantInd="false" Gender="{gender}">
+      <PersonName>
+        <NamePrefix>{name_prefix}</NamePrefix>
+        <GivenName>{first_name}</GivenName>
+        <Surname>{last_name}</Surname>
+      </PersonName>
+
+{contact_xml}      <Document DocID="{passport}"
+                DocType="{doc_type}"
+                DocIssueCountry="{issue}"
+                DocHolderNationality="{nation}"
+                ExpireDate="{exp}"/>
+    </AirTraveler>'''
+
+# Only the first traveler carries contact fields (keeps XML closer to common OTA patterns).
+_AIR_TRAVELER_CONTACT_TMPL = '''      <Telephone PhoneNumber="{phone}"/>
+      <Email>{email}</Email>
+'''
+
+_FULFILLMENT_TMPL = '''  <Fulfillment>
+    <Name>
+      <GivenName>{first_name}</GivenName>
+      <Surname>{last_name}</Surname>
+      <TPA_Extensions>
+        <TPA_Extension>
+          <Username>{email}</Username>
+          <Country>{country}</Country>
+          <PersianLasttName>{last_name}</PersianLasttName>
+          <Gender>{gender}</Gender>
+          <City>{city}</City>
+          <PersianFirstName>{first_name}</PersianFirstName>
+          <Mobile>{phone}</Mobile>
+          <Nationality>{country}</Nationality>
+          <NationalityNum>{nationality_num}</NationalityNum>
+        </TPA_Extension>
+      </TPA_Extensions>
+    </Name>
+  </Fulfillment>'''
+
+_FLIGHT_SEGMENT_HEAD_TMPL = '''        <FlightSegment DepartureDateTime="{dep_dt}"
+                       ArrivalDateTime="{arr_dt}"
+                       StopQuantity="0"
+                       RPH="{rph}"
+                       FlightNumber="{flt_no}">
+          <DepartureAirport LocationCode="{dep_lc}"/>
+          <ArrivalAirport LocationCode="{arr_lc}"/>
+          <OperatingAirline CompanyShortName="{op_name}" Code="{op_code}"/>
+'''
+
+_FLIGHT_SEGMENT_EQUIPMENT_TMPL = '''          <Equipment AirEquipType="{eq_type}"/>
+'''
+
+_FLIGHT_SEGMENT_TAIL_TMPL = '''          <TPA_Extensions>
+            <TPA_Extension>
+              <DepartureAirport>{dep_full}</DepartureAirport>
+              <departureCountry>{dep_country}</departureCountry>
+              <departureCity>{dep_city}</departureCity>
+              <arrivalCity>{arr_city}</arrivalCity>
+              <ArrivalAirport>{arr_full}</ArrivalAirport>
+              <arrivalCountry>{arr_country}</arrivalCountry>
+              <freeBaggage>{free_bag}</freeBaggage>
+              <aircraftName>{aircraft_name}</aircraftName>
+            </TPA_Extension>
+          </TPA_Extensions>
+          <MarketingAirline Code="{mk_code}"/>
+        </FlightSegment>'''
+
+# Segments with and without an <Equipment> line; picked by `bool(eq_type)`.
+_FLIGHT_SEGMENT_TMPLS = (
+    _FLIGHT_SEGMENT_HEAD_TMPL + _FLIGHT_SEGMENT_TAIL_TMPL,
+    _FLIGHT_SEGMENT_HEAD_TMPL + _FLIGHT_SEGMENT_EQUIPMENT_TMPL + _FLIGHT_SEGMENT_TAIL_TMPL,
+)
+
+# The envelope is emitted as a list of parts joined once, so the (large) leg, traveler and
+# fulfillment fragments are copied into the final document a single time.
+_AIRBOOK_HEAD_TMPL = '''<?xml version="1.0" encoding="UTF-8"?>
+<OTA_AirBookRQ>
+
+  <AirItinerary DirectionInd="{direction}">
+    <OriginDestinationOptions>'''
+
+_AIRBOOK_ODO_OPEN = '''
+      <OriginDestinationOption>
+'''
+
+_AIRBOOK_ODO_CLOSE = '''
+      </OriginDestinationOption>'''
+
+_AIRBOOK_PRICE_TMPL = '''
+    </OriginDestinationOptions>
+  </AirItinerary>
+
+  <PriceInfo>
+    <ItinTotalFare>
+      <BaseFare{base_cur_dec} Amount="{base_amt}"/>
+      <TotalFare{tot_cur_dec} Amount="{tot_amt}"/>
+    </ItinTotalFare>
+  </PriceInfo>
+
+  <TravelerInfo>
+'''
+
+# Currency/decimal-places attribute pairs for the fares WINGS actually returns, prebuilt so the
+# common case is a single dict hit; anything else is escaped on the fly by _cur_dec_attrs.
+_CUR_DEC_ATTRS = {
+    (cur, dec): f' CurrencyCode="{cur}" DecimalPlaces="{dec}"'
+    for cur in ("IQD", "USD", "EUR")
+    for dec in ("0", "2", "3")
+}
+
+_AIRBOOK_TRAVELERS_CLOSE = '''
+  </TravelerInfo>
+
+'''
+
+_AIRBOOK_TICKETING_TMPL = '''
+
+  <Ticketing>
+    <TicketingVendor{tv_attrs}/>
+  </Ticketing>
+
+</OTA_AirBookRQ>
+'''
+
 
 # ------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------
+# Parser for AirBook responses: no entity resolution, and best-effort recovery from
+# malformed markup (the regex fallback in _extract_refs still covers hopeless cases).
+# collect_ids=False skips building the xml:id hash table, which nothing here looks up.
+# A streaming iterparse with early exit was measured and lost: BookingReferenceID sits at the
+# end of AirReservation, so it would walk the whole document anyway, with per-event overhead.
+_XML_PARSER = (
+    _LET.XMLParser(recover=True, resolve_entities=False, huge_tree=False, collect_ids=False)
+    if _LET is not None
+    else None
+)
+
+# BookingReferenceID descendants in any (or no) namespace, compiled once for lxml.
+_BOOKREF_XPATH = (
+    _LET.XPath("descendant::*[local-name()='BookingReferenceID']") if _LET is not None else None
+)
+
+# Fallback for AirBook responses that don't parse: each BookingReferenceID tag, then its attributes.
+_BOOKREF_TAG_RE = re.compile(r"<(?:[\w.-]+:)?BookingReferenceID\b([^>]*)>")
+_BOOKREF_ATTR_RE = re.compile(r'\s(ID|ID_Context)="([^"]*)"')
+
+# Quote characters escaped in attribute values on top of &, < and >.
+_XML_ATTR_ENTITIES = {'"': "&quot;", "'": "&apos;"}
+
+# Characters XML 1.0 forbids outright (no escape exists), e.g. control bytes pasted into names.
+_XML_ILLEGAL_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
 def _normalize_cabin(v: str | None) -> str:
     """Map user cabin to WINGS cabin value."""
     v = (v or "").strip().lower()
@@ -117,11 +330,184 @@ def _normalize_cabin(v: str | None) -> str:
     return "Economy"
 
 
+def _norm(s: str | None) -> str:
+    if s is None:
+        return ""
+    return _XML_ILLEGAL_RE.sub("", str(s).replace("\r", "").replace("\n", " ")).strip()
+
+
+# Escaped forms of string values. The vocabulary repeats heavily across bookings (currencies,
+# decimal places, airline/vendor codes, airports), so most lookups are hits.
+@lru_cache(maxsize=4096)
+def _esc_attr_str(s: str) -> str:
+    return _xml_escape(_norm(s), _XML_ATTR_ENTITIES)
+
+
+@lru_cache(maxsize=4096)
+def _esc_text_str(s: str) -> str:
+    return _xml_escape(_norm(s))
+
+
+def _esc_attr(s: str | None) -> str:
+    if type(s) is str:
+        return _esc_attr_str(s)
+    return _xml_escape(_norm(s), _XML_ATTR_ENTITIES)
+
+
+def _esc_text(s: str | None) -> str:
+    if type(s) is str:
+        return _esc_text_str(s)
+    return _xml_escape(_norm(s))
+
+
+def _cur_dec_attrs(cur, dec) -> str:
+    """` CurrencyCode=".." DecimalPlaces=".."` for a fare element."""
+    if type(cur) is str and type(dec) is str:
+        frag = _CUR_DEC_ATTRS.get((cur, dec))
+        if frag is not None:
+            return frag
+    return f' CurrencyCode="{_esc_attr(cur)}" DecimalPlaces="{_esc_attr(dec)}"'
+
+
+@lru_cache(maxsize=256)
+def _ticketing_vendor_attrs_str(name: str, code: str, context: str) -> str:
+    return f' CompanyShortName="{_esc_attr_str(name)}" Code="{_esc_attr_str(code)}" CodeContext="{_esc_attr_str(context)}"'
+
+
+def _ticketing_vendor_attrs(name, code, context) -> str:
+    """TicketingVendor attributes; a booking site only ever sees a handful of vendor triples."""
+    if type(name) is str and type(code) is str and type(context) is str:
+        return _ticketing_vendor_attrs_str(name, code, context)
+    return f' CompanyShortName="{_esc_attr(name)}" Code="{_esc_attr(code)}" CodeContext="{_esc_attr(context)}"'
+
+
+def _as_list(v) -> list:
+    """WINGS collapses one-element arrays to the bare object (and empty ones to null/{}); always return a list."""
+    if isinstance(v, list):
+        return v
+    return [v] if v else []
+
+
+def _seg_sig(seg: dict) -> str:
+    """Stable signature for matching a return option to a roundtrip-priced itinerary."""
+    get = seg.get
+    dep = ((get("departureAirport") or {}).get("locationCode") or "").upper()
+    arr = ((get("arrivalAirport") or {}).get("locationCode") or "").upper()
+    dep_dt = (get("departureDateTime") or "").strip()
+    arr_dt = (get("arrivalDateTime") or "").strip()
+    airline = ((get("operatingAirline") or {}).get("code") or (get("marketingAirline") or {}).get("code") or "").upper()
+    flight = str(get("flightNumber") or "").strip()
+    return f"{dep}|{arr}|{dep_dt}|{arr_dt}|{airline}|{flight}"
+
+
+def _norm_sig_from_result(r: dict) -> str:
+    """Same signature as `_seg_sig`, taken from the first segment of a normalized result."""
+    try:
+        s0 = (r.get("segments") or [])[0] or {}
+    except Exception:
+        s0 = {}
+    get = s0.get
+    dep = str(get("dep") or "").upper()
+    arr = str(get("arr") or "").upper()
+    dep_dt = str(get("dep_dt") or "").strip()
+    arr_dt = str(get("arr_dt") or "").strip()
+    airline = str(get("airline") or "").upper()
+    flight = str(get("flight") or "").strip()
+    return f"{dep}|{arr}|{dep_dt}|{arr_dt}|{airline}|{flight}"
+
+
+def _fmt_money(v):
+    """Format WINGS amounts consistently with the frontend (commas, 0 or 2 decimals).
+    Returns: (formatted_str, raw_float_or_none)
+    """
+    # Whole amounts (the common case: ints or digit-only strings) skip the float round-trip.
+    if type(v) is int:
+        return (f"{v:,}", float(v))
+    if isinstance(v, str) and v.isascii() and v.isdigit():
+        n = int(v)
+        return (f"{n:,}", float(n))
+
+    try:
+        n = float(v)
+    except Exception:
+        s = "" if v is None else str(v)
+        return (s, None)
+
+    if abs(n - round(n)) < 1e-9:
+        return (f"{int(round(n)):,}", float(n))
+    return (f"{n:,.2f}", float(n))
+
+
+# ------------------------------------------------------------
+# AirLowFareSearch payloads
+# ------------------------------------------------------------
+# The static parts are shared across requests; payloads are only ever serialized, never mutated.
+_SEARCH_PROCESSING_INFO = {"SearchType": "STANDARD"}
+_TRAVEL_PREFERENCES = {
+    cabin: [{"CabinPref": [{"Cabin": cabin}]}] for cabin in ("Economy", "Business")
+}
+
+
+def _od_info(date: str | None, origin: str, destination: str) -> dict:
+    return {
+        "DepartureDateTime": {"value": date},
+        "OriginLocation": {"LocationCode": origin},
+        "DestinationLocation": {"LocationCode": destination},
+    }
+
+
+def _traveler_info_summary(pax: "Pax") -> dict:
+    return {
+        "AirTravelerAvail": [
+            {
+                "PassengerTypeQuantity": [
+                    {"Code": "ADT", "Quantity": pax.adults},
+                    {"Code": "CHD", "Quantity": pax.children},
+                    {"Code": "INF", "Quantity": pax.infants},
+                ]
+            }
+        ]
+    }
+
+
+def _search_payload(od_infos: list[dict], cabin: str, travelers: dict) -> dict:
+    return {
+        "ProcessingInfo": _SEARCH_PROCESSING_INFO,
+        "OriginDestinationInformation": od_infos,
+        "TravelPreferences": _TRAVEL_PREFERENCES[cabin],
+        "TravelerInfoSummary": travelers,
+    }
+
+
+def _build_rt_map(resp_rt: dict) -> dict:
+    """Build a lookup from a roundtrip search: return-segment signature -> (currency, amount)."""
+    pis = _as_list((resp_rt or {}).get("pricedItineraries", {}).get("pricedItinerary"))
+
+    out = {}
+    for pi in pis:
+        # Well-formed itineraries have every key, so index directly and let anything missing or
+        # mis-shaped (KeyError/IndexError/TypeError/AttributeError) skip the itinerary.
+        try:
+            total_fare = _as_list(pi["airItineraryPricingInfo"]["itinTotalFare"])[0]["totalFare"]
+            amt = total_fare["amount"]
+            if amt is None:
+                continue
+            odo_list = _as_list(pi["airItinerary"]["originDestinationOptions"]["originDestinationOption"])
+            seg0 = _as_list(odo_list[1]["flightSegment"])[0]
+            sig = _seg_sig(seg0 or {})
+            amt_disp, amt_f = _fmt_money(amt)
+            out[sig] = {"currency": total_fare.get("currencyCode") or "IQD", "amount": amt_disp, "amount_raw": amt_f}
+        except Exception:
+            continue
+
+    return out
+
+
 @router.post("/api/availability")
-async def availability(req: AvailabilityRequest):
+async def availability(req: AvailabilityRequest, http: httpx.AsyncClient = Depends(get_http)):
     client = get_client_from_env()
     if not client or _wings_config_missing():
-        return JSONResponse(
+        return FastJSONResponse(
             {
                 "error": (
                     "WINGS credentials not configured. "
@@ -135,745 +521,627 @@ async def availability(req: AvailabilityRequest):
     # Provider permissions / filters
     pol = _ota_policy()
     if not pol["availability"]:
-        return {"meta": {"disabled": True, "reason": "Provider OTA is disabled"}, "results_outbound": []}
-
-    cache_key = _avail_cache_key(req, pol)
-    cached = _avail_cache_get(cache_key)
-    if cached:
-        return JSONResponse(cached)
-
-    def _seg_sig(seg: dict) -> str:
-        """Stable signature for matching a return option to a roundtrip-priced itinerary."""
-        dep = ((seg.get("departureAirport") or {}).get("locationCode") or "").upper()
-        arr = ((seg.get("arrivalAirport") or {}).get("locationCode") or "").upper()
-        dep_dt = (seg.get("departureDateTime") or "").strip()
-        arr_dt = (seg.get("arrivalDateTime") or "").strip()
-        op = (seg.get("operatingAirline") or {})
-        mk = (seg.get("marketingAirline") or {})
-        airline = (op.get("code") or mk.get("code") or "").upper()
-        flight = str(seg.get("flightNumber") or "").strip()
-        return "|".join([dep, arr, dep_dt, arr_dt, airline, flight])
-
-    def _norm_sig_from_result(r: dict) -> str:
-        try:
-            s0 = (r.get("segments") or [])[0] or {}
-        except Exception:
-            s0 = {}
-        dep = str(s0.get("dep") or "").upper()
-        arr = str(s0.get("arr") or "").upper()
-        dep_dt = str(s0.get("dep_dt") or "").strip()
-        arr_dt = str(s0.get("arr_dt") or "").strip()
-        airline = str(s0.get("airline") or "").upper()
-        flight = str(s0.get("flight") or "").strip()
-        return "|".join([dep, arr, dep_dt, arr_dt, airline, flight])
-
-    def _fmt_money(v):
-        """Format WINGS amounts consistently with the frontend (commas, 0 or 2 decimals).
-        Returns: (formatted_str, raw_float_or_none)
-        """
-        try:
-            n = float(v)
-        except Exception:
-            s = "" if v is None else str(v)
-            return (s, None)
-
-        if abs(n - round(n)) < 1e-9:
-            return (f"{int(round(n)):,}", float(n))
-        return (f"{n:,.2f}", float(n))
+        return FastJSONResponse({"meta": {"disabled": True, "reason": "Provider OTA is disabled"}, "results_outbound": []})
 
     cabin = _normalize_cabin(req.cabin)
 
-    async def _roundtrip_price_map() -> dict:
-        """Build a lookup: return-segment signature -> (currency, amount)."""
-        if req.trip_type != "roundtrip" or not req.return_date:
-            return {}
+    travelers = _traveler_info_summary(req.pax)
+    out_odi = _od_info(req.date, req.from_, req.to)
+    payload = _search_payload([out_odi], cabin, travelers)
 
-        payload_rt = {
-            "ProcessingInfo": {"SearchType": "STANDARD"},
-            "OriginDestinationInformation": [
-                {
-                    "DepartureDateTime": {"value": req.date},
-                    "OriginLocation": {"LocationCode": req.from_},
-                    "DestinationLocation": {"LocationCode": req.to},
-                },
-                {
-                    "DepartureDateTime": {"value": req.return_date},
-                    "OriginLocation": {"LocationCode": req.to},
-                    "DestinationLocation": {"LocationCode": req.from_},
-                },
-            ],
-            "TravelPreferences": [{"CabinPref": [{"Cabin": cabin}]}],
-            "TravelerInfoSummary": {
-                "AirTravelerAvail": [
-                    {
-                        "PassengerTypeQuantity": [
-                            {"Code": "ADT", "Quantity": req.pax.adults},
-                            {"Code": "CHD", "Quantity": req.pax.children},
-                            {"Code": "INF", "Quantity": req.pax.infants},
-                        ]
-                    }
-                ]
-            },
-        }
-
-        resp_rt = await client.air_low_fare_search(payload_rt)
-
-        pis = (resp_rt or {}).get("pricedItineraries", {}).get("pricedItinerary") or []
-        if not isinstance(pis, list):
-            pis = [pis]
-
-        out = {}
-        for pi in pis:
-            try:
-                odo_list = (
-                    (pi.get("airItinerary", {}) or {})
-                    .get("originDestinationOptions", {})
-                    .get("originDestinationOption")
-                    or []
-                )
-                if not isinstance(odo_list, list):
-                    odo_list = [odo_list]
-                if len(odo_list) < 2:
-                    continue
-
-                segs_ret = (odo_list[1] or {}).get("flightSegment") or []
-                if not isinstance(segs_ret, list):
-                    segs_ret = [segs_ret]
-                if not segs_ret:
-                    continue
-
-                sig = _seg_sig(segs_ret[0] or {})
-
-                fare0 = ((pi.get("airItineraryPricingInfo") or {}).get("itinTotalFare") or [])
-                if not isinstance(fare0, list):
-                    fare0 = [fare0]
-                fare0 = fare0[0] if fare0 else {}
-                total_fare = (fare0 or {}).get("totalFare") or {}
-
-                ccy = (
-                    (total_fare.get("currencyCode") or "IQD")
-                    if isinstance(total_fare, dict)
-                    else "IQD"
-                )
-                amt = total_fare.get("amount") if isinstance(total_fare, dict) else None
-                if amt is None:
-                    continue
+    # Provider filters (blocked airlines); empty/None when nothing should be filtered out.
+    blocked = pol.get("blocked_airlines_set") if pol.get("filters_enabled", True) else None
 
-                amt_disp, amt_f = _fmt_money(amt)
-                out[sig] = {"currency": ccy, "amount": amt_disp, "amount_raw": amt_f}
-            except Exception:
-                continue
-
-        return out
-
-    payload = {
-        "ProcessingInfo": {"SearchType": "STANDARD"},
-        "OriginDestinationInformation": [
-            {
-                "DepartureDateTime": {"value": req.date},
-                "OriginLocation": {"LocationCode": req.from_},
-                "DestinationLocation": {"LocationCode": req.to},
-            }
-        ],
-        "TravelPreferences": [{"CabinPref": [{"Cabin": cabin}]}],
-        "TravelerInfoSummary": {
-            "AirTravelerAvail": [
-                {
-                    "PassengerTypeQuantity": [
-                        {"Code": "ADT", "Quantity": req.pax.adults},
-                        {"Code": "CHD", "Quantity": req.pax.children},
-                        {"Code": "INF", "Quantity": req.pax.infants},
-                    ]
-                }
-            ]
-        },
-    }
+    def _is_blocked(it: dict) -> bool:
+        try:
+            s0 = (it.get("segments") or [])[0] or {}
+        except Exception:
+            s0 = {}
+        code = str(s0.get("airline") or "").strip().upper()
+        return code in blocked
 
     try:
         results_return = []
         rt_map = {}
 
         if req.trip_type == "roundtrip" and req.return_date:
-            payload_ret = {
-                **payload,
-                "OriginDestinationInformation": [
-                    {
-                        "DepartureDateTime": {"value": req.return_date},
-                        "OriginLocation": {"LocationCode": req.to},
-                        "DestinationLocation": {"LocationCode": req.from_},
-                    }
-                ],
-            }
-            resp_out_task = asyncio.create_task(client.air_low_fare_search(payload))
-            resp_ret_task = asyncio.create_task(client.air_low_fare_search(payload_ret))
-            rt_map_task = asyncio.create_task(_roundtrip_price_map())
+            ret_odi = _od_info(req.return_date, req.to, req.from_)
+            payload_ret = _search_payload([ret_odi], cabin, travelers)
+            payload_rt = _search_payload([out_odi, ret_odi], cabin, travelers)
+
+            # The three searches are independent: total latency is the slowest one, not the sum.
+            # The roundtrip pricing search is best-effort and capped so it can't hold up the others.
+            norm_out, norm_ret, resp_rt = await asyncio.gather(
+                _cached_search(client, payload, normalize_priced_itineraries, http=http),
+                _cached_search(client, payload_ret, normalize_priced_itineraries, http=http),
+                asyncio.wait_for(_cached_search(client, payload_rt, _build_rt_map, http=http), timeout=8),
+                return_exceptions=True,
+            )
+            if isinstance(norm_out, BaseException):
+                raise norm_out
+            if isinstance(norm_ret, BaseException):
+                raise norm_ret
 
-            resp_out = await resp_out_task
-            norm_out = normalize_priced_itineraries(resp_out)
             meta = norm_out.get("meta")
             results = norm_out.get("results_outbound") or []
-
-            resp_ret = await resp_ret_task
-            norm_ret = normalize_priced_itineraries(resp_ret)
             results_return = norm_ret.get("results_outbound") or []
 
-            # Enrich return results with true roundtrip totals (best-effort).
-            try:
-                rt_map = await asyncio.wait_for(rt_map_task, timeout=8)
-            except Exception:
-                rt_map = {}
-            if rt_map:
+            # Only the small signature -> price map of the roundtrip search is kept (and cached).
+            rt_map = {} if isinstance(resp_rt, BaseException) else resp_rt
+            # One pass over the return options: drop blocked airlines and attach the true
+            # roundtrip totals (best-effort) from the roundtrip-priced search.
+            if rt_map or blocked:
+                kept = []
                 for rr in results_return:
-                    sig = _norm_sig_from_result(rr)
-                    info = rt_map.get(sig)
-                    if info:
-                        rr["roundtrip_total_currency"] = info.get("currency")
-                        rr["roundtrip_total_amount"] = info.get("amount")
-                        rr["roundtrip_amount_raw"] = info.get("amount_raw")
+                    if blocked and _is_blocked(rr):
+                        continue
+                    if rt_map:
+                        info = rt_map.get(_norm_sig_from_result(rr))
+                        if info:
+                            rr = dict(rr)  # the cached return-leg result is shared with other searches
+                            rr["roundtrip_total_currency"] = info.get("currency")
+                            rr["roundtrip_total_amount"] = info.get("amount")
+                            rr["roundtrip_amount_raw"] = info.get("amount_raw")
+                    kept.append(rr)
+                results_return = kept
         else:
-            resp_out = await client.air_low_fare_search(payload)
-            norm_out = normalize_priced_itineraries(resp_out)
+            norm_out = await _cached_search(client, payload, normalize_priced_itineraries, http=http)
             meta = norm_out.get("meta")
             results = norm_out.get("results_outbound") or []
 
-        # Apply provider filters (blocked airlines)
-        if pol.get("filters_enabled", True) and pol.get("blocked_airlines"):
-            blocked = set([str(x).upper() for x in (pol.get("blocked_airlines") or []) if str(x).strip()])
-
-            def _is_blocked(it: dict) -> bool:
-                try:
-                    s0 = (it.get("segments") or [])[0] or {}
-                except Exception:
-                    s0 = {}
-                code = str(s0.get("airline") or "").strip().upper()
-                return code in blocked
+        if blocked and isinstance(results, list):
+            results = [r for r in results if not _is_blocked(r)]
 
-            if isinstance(results, list):
-                results = [r for r in results if not _is_blocked(r)]
-            if isinstance(results_return, list):
-                results_return = [r for r in results_return if not _is_blocked(r)]
-
-        payload_out = {"meta": meta, "results": results, "results_return": results_return}
-        _avail_cache_set(cache_key, payload_out)
-        return JSONResponse(payload_out)
+        return FastJSONResponse({"meta": meta, "results": results, "results_return": results_return})
 
     except HTTPException:
         raise
     except Exception as e:
         # When WINGS rejects payloads etc., it's often better to surface as 502,
         # but we keep your original behavior and message.
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 
-@router.post("/api/book")
-async def book(req: BookingRequest):
-    client = get_client_from_env()
-    if not client or _wings_config_missing():
-        return JSONResponse(
-            {
-                "error": (
-                    "WINGS credentials not configured. "
-                    "Set WINGS_AUTH_TOKEN (or AUTH_TOKEN) and optionally "
-                    "WINGS_BASE_URL/SEARCH_URL/BOOK_URL."
-                )
-            },
-            status_code=500,
-        )
+# ------------------------------------------------------------
+# Booking (OTA_AirBookRQ) builders
+# ------------------------------------------------------------
+def _pick_equipment(seg: dict) -> str:
+    eq = seg.get("equipment")
+    if isinstance(eq, list) and eq:
+        return str((eq[0] or {}).get("airEquipType") or "")
+    if isinstance(eq, dict):
+        return str(eq.get("airEquipType") or "")
+    return ""
+
+
+def _pick_tpa_any(seg: dict) -> dict:
+    # WINGS JSON structure often: tpaextensions.any[0]
+    tpa = seg.get("tpaextensions") or seg.get("tpaExtensions") or {}
+    any0 = (tpa.get("any") or [])
+    if isinstance(any0, list) and any0:
+        return any0[0] or {}
+    if isinstance(any0, dict):
+        return any0
+    return {}
+
+
+# Where a TicketingVendor block may live, in priority order:
+#   - normalized itinerary (frontend): pi.ticketing {companyShortName, code, codeContext}
+#   - already-normalized ticketing block: pi.ticketingVendor / TicketingVendor (dict)
+#   - priced itinerary (WINGS JSON): pi.ticketingInfo.ticketingVendor, plus case variants
+_TICKETING_VENDOR_PATHS = (
+    ("ticketing",),
+    ("ticketingVendor",),
+    ("TicketingVendor",),
+    ("ticketingInfo", "ticketingVendor"),
+    ("ticketingInfo", "TicketingVendor"),
+    ("TicketingInfo", "ticketingVendor"),
+    ("TicketingInfo", "TicketingVendor"),
+)
+
+
+def _ticketing_vendor(pi: dict) -> dict:
+    """Extract TicketingVendor in a case/shape-tolerant way.
+
+    Walks `_TICKETING_VENDOR_PATHS` and uses the first non-empty dict found.
+    """
+    for path in _TICKETING_VENDOR_PATHS:
+        node = pi
+        for k in path:
+            node = node.get(k) if isinstance(node, dict) else None
+        if node and isinstance(node, dict):
+            break
+    else:
+        node = {}
+    get = node.get
+    return {
+        "companyShortName": get("companyShortName") or get("CompanyShortName") or "",
+        "code": get("code") or get("Code") or "",
+        "codeContext": get("codeContext") or get("CodeContext") or "",
+    }
 
-    # Provider permissions / filters
-    pol = _ota_policy()
-    if not pol["availability"]:
-        return {"meta": {"disabled": True, "reason": "Provider OTA is disabled"}, "results_outbound": []}
 
-    # If ticketing is not effective (permissions set to availability-only or schedule disables ticketing),
-    # return a pending response so the frontend can queue it in Pending bookings.
-    if not pol.get("ticketing_effective", True):
-        from uuid import uuid4
-        pending_id = "PND-" + uuid4().hex[:10].upper()
+def _pricing(pi: dict) -> dict:
+    """Extract pricing in a tolerant way.
+
+    Supported shapes:
+      - priced itinerary (WINGS JSON): airItineraryPricingInfo.itinTotalFare[0].baseFare/totalFare
+      - normalized itinerary (frontend): total_currency + amount_raw / total_amount
+    """
+    # Normalized itinerary
+    if isinstance(pi, dict) and (pi.get("total_currency") or pi.get("amount_raw") or pi.get("total_amount")) and not pi.get("airItineraryPricingInfo"):
+        cur = str(pi.get("total_currency") or "IQD")
+        amt = pi.get("amount_raw")
+        if amt is None:
+            # total_amount is often string, keep numeric-ish characters
+            try:
+                amt = float(str(pi.get("total_amount") or "").replace(",", "").strip() or 0)
+            except Exception:
+                amt = 0
+        try:
+            amt_str = str(int(float(amt))) if float(amt).is_integer() else str(float(amt))
+        except Exception:
+            amt_str = str(amt or "")
         return {
-            "pending": True,
-            "status": "pending",
-            "pending_id": pending_id,
-            "provider": "OTA",
-            "reason": "Ticketing is disabled by permissions or schedule.",
+            "baseCur": cur,
+            "baseDec": "2",
+            "baseAmt": amt_str,
+            "totCur": cur,
+            "totDec": "2",
+            "totAmt": amt_str,
         }
 
-    import json as _json
-    import re as _re
-    from datetime import datetime as _dt
-    from xml.etree import ElementTree as _ET
+    # WINGS priced itinerary
+    itin_total = _as_list((pi.get("airItineraryPricingInfo") or {}).get("itinTotalFare"))
+    itin_total = itin_total[0] if itin_total else {}
+    base = itin_total.get("baseFare") or {}
+    total = itin_total.get("totalFare") or {}
+
+    # Fallbacks: if base missing, use total
+    if not isinstance(base, dict):
+        base = {}
+    if not isinstance(total, dict):
+        total = {}
 
-    def _norm(s: str | None) -> str:
-        if s is None:
+    if not base and total:
+        base = dict(total)
+
+    def _f(n):
+        try:
+            return str(n)
+        except Exception:
             return ""
-        return str(s).replace("\r", "").replace("\n", " ").strip()
-
-    def _esc_attr(s: str | None) -> str:
-        s = _norm(s)
-        return (
-            s.replace("&", "&amp;")
-            .replace('"', "&quot;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace("'", "&apos;")
-        )
 
-    def _esc_text(s: str | None) -> str:
-        s = _norm(s)
-        return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return {
+        "baseCur": _f(base.get("currencyCode") or total.get("currencyCode") or "IQD"),
+        "baseDec": _f(base.get("decimalPlaces") or total.get("decimalPlaces") or "2"),
+        "baseAmt": _f(base.get("amount") or ""),
+        "totCur": _f(total.get("currencyCode") or base.get("currencyCode") or "IQD"),
+        "totDec": _f(total.get("decimalPlaces") or base.get("decimalPlaces") or "2"),
+        "totAmt": _f(total.get("amount") or ""),
+    }
 
-    def _as_list(v):
-        if v is None:
-            return []
-        if isinstance(v, list):
-            return v
-        return [v]
-
-    def _pick_equipment(seg: dict) -> str:
-        eq = seg.get("equipment")
-        if isinstance(eq, list) and eq:
-            return str((eq[0] or {}).get("airEquipType") or "")
-        if isinstance(eq, dict):
-            return str(eq.get("airEquipType") or "")
-        return ""
 
-    def _pick_tpa_any(seg: dict) -> dict:
-        # WINGS JSON structure often: tpaextensions.any[0]
-        tpa = seg.get("tpaextensions") or seg.get("tpaExtensions") or {}
-        any0 = (tpa.get("any") or [])
-        if isinstance(any0, list) and any0:
-            return any0[0] or {}
-        if isinstance(any0, dict):
-            return any0
-        return {}
-
-    def _ticketing_vendor(pi: dict) -> dict:
-        """Extract TicketingVendor in a case/shape-tolerant way.
-
-        Supported shapes:
-          - priced itinerary (WINGS JSON): pi.ticketingInfo.ticketingVendor
-          - case variants: TicketingInfo/TicketingVendor
-          - normalized itinerary (frontend): pi.ticketing {companyShortName, code, codeContext}
-          - already-normalized ticketing block: pi.ticketingVendor / TicketingVendor (dict)
-        """
-        def _as_dict(v):
-            return v if isinstance(v, dict) else {}
-
-        # Normalized itinerary often has: {"ticketing": {"companyShortName":..,"code":..,"codeContext":..}}
-        t_norm = _as_dict(pi.get("ticketing"))
-        if t_norm:
-            return {
-                "companyShortName": (t_norm.get("companyShortName") or t_norm.get("CompanyShortName") or ""),
-                "code": (t_norm.get("code") or t_norm.get("Code") or ""),
-                "codeContext": (t_norm.get("codeContext") or t_norm.get("CodeContext") or ""),
+def _segments_from_pi(pi: dict, leg_index: int) -> list[dict]:
+    """Return a list of segment dicts in WINGS-like structure.
+
+    Accepts either:
+      1) WINGS priced itinerary dict (airItinerary.originDestinationOptions.originDestinationOption[].flightSegment[])
+      2) normalized itinerary dict (segments[] with dep/arr/dep_dt/arr_dt/flight/airline/airline_name/equipment/baggage/aircraft)
+    """
+    # Case 1: WINGS priced itinerary shape (already supported)
+    odo_list = _as_list(
+        ((pi.get("airItinerary") or {}).get("originDestinationOptions") or {}).get("originDestinationOption")
+    )
+    if odo_list and leg_index < len(odo_list):
+        segs = _as_list((odo_list[leg_index] or {}).get("flightSegment"))
+        return [s for s in segs if isinstance(s, dict)]
+
+    # Case 1b: capitalization variants
+    odo_list2 = _as_list(
+        ((pi.get("AirItinerary") or {}).get("OriginDestinationOptions") or {}).get("OriginDestinationOption")
+    )
+    if odo_list2 and leg_index < len(odo_list2):
+        segs = _as_list((odo_list2[leg_index] or {}).get("FlightSegment"))
+        return [s for s in segs if isinstance(s, dict)]
+
+    # Case 2: normalized itinerary
+    segs_norm = pi.get("segments")
+    if isinstance(segs_norm, list):
+        if leg_index != 0:
+            return []
+        out: list[dict] = []
+        for s in segs_norm:
+            if not isinstance(s, dict):
+                continue
+            dep = (s.get("dep") or "").upper()
+            arr = (s.get("arr") or "").upper()
+            dep_dt = s.get("dep_dt") or ""
+            arr_dt = s.get("arr_dt") or ""
+            flt = s.get("flight") or ""
+            airline = (s.get("airline") or "")
+            airline_name = (s.get("airline_name") or "")
+            equip = s.get("equipment") or ""
+            baggage = s.get("baggage") or ""
+            aircraft = s.get("aircraft") or ""
+
+            seg = {
+                "departureDateTime": dep_dt,
+                "arrivalDateTime": arr_dt,
+                "flightNumber": flt,
+                "departureAirport": {"locationCode": dep},
+                "arrivalAirport": {"locationCode": arr},
+                "operatingAirline": {"code": airline, "companyShortName": airline_name},
+                "marketingAirline": {"code": airline},
+                "equipment": {"airEquipType": equip} if equip else {},
+                "tpaextensions": {"any": [{"freeBaggage": baggage, "aircraftName": aircraft}]},
             }
+            out.append(seg)
+        return out
 
-        # Direct dict vendor blocks
-        for k in ("ticketingVendor", "TicketingVendor"):
-            v = _as_dict(pi.get(k))
-            if v:
-                return {
-                    "companyShortName": (v.get("companyShortName") or v.get("CompanyShortName") or ""),
-                    "code": (v.get("code") or v.get("Code") or ""),
-                    "codeContext": (v.get("codeContext") or v.get("CodeContext") or ""),
+    return []
+
+
+def _build_air_travelers(passengers: list[Passenger], contact: Contact | None) -> str:
+    # Provide contact + document defaults if missing.
+    default_phone = (contact.phone if contact and contact.phone else "9647500000000")
+    default_email = (contact.email if contact and contact.email else "dler.azeez@example.com")
+    default_issue = (contact.country if contact and contact.country else "IQ")
+    default_nation = default_issue
+
+    contact_xml = _AIR_TRAVELER_CONTACT_TMPL.format_map(
+        {"phone": _esc_attr(default_phone), "email": _esc_text(default_email)}
+    )
+    # Passengers arrive as validated Passenger models (pydantic-core checks the whole list while
+    # parsing the request body), so the loop reads typed attributes and only fills defaults.
+    chunks = []
+    for i, p in enumerate(passengers):
+        gender = p.gender or "M"
+        chunks.append(
+            _AIR_TRAVELER_TMPL.format_map(
+                {
+                    "birth_date": _esc_attr(p.birth_date),
+                    "pax_type": _esc_attr(p.pax_type),
+                    "gender": _esc_attr(gender),
+                    "name_prefix": _esc_text(p.name_prefix or ("MS" if gender.upper() == "F" else "MR")),
+                    "first_name": _esc_text(p.first_name),
+                    "last_name": _esc_text(p.last_name),
+                    "contact_xml": contact_xml if i == 0 else "",
+                    # Generate a reasonably unique fallback passport if not supplied.
+                    "passport": _esc_attr(p.passport or ("P" + str((i + 7) % 10) * 8)),
+                    "doc_type": _esc_attr(p.doc_type or "2"),
+                    "issue": _esc_attr((p.issue_country or default_issue)[:2].upper()),
+                    "nation": _esc_attr((p.nationality or default_nation)[:2].upper()),
+                    "exp": _esc_attr(p.expire_date or "2030-01-01"),
                 }
-
-        # WINGS-like structures
-        ti = _as_dict(pi.get("ticketingInfo")) or _as_dict(pi.get("TicketingInfo"))
-        tv = _as_dict(ti.get("ticketingVendor")) or _as_dict(ti.get("TicketingVendor"))
-        return {
-            "companyShortName": tv.get("companyShortName") or tv.get("CompanyShortName") or "",
-            "code": tv.get("code") or tv.get("Code") or "",
-            "codeContext": tv.get("codeContext") or tv.get("CodeContext") or "",
+            )
+        )
+    return "\n".join(chunks)
+
+
+def _build_fulfillment(passengers: list[Passenger], contact: Contact | None) -> str:
+    p0 = passengers[0] if passengers else _FALLBACK_PASSENGER
+    phone = (contact.phone if contact and contact.phone else "9647500000000")
+    email = (contact.email if contact and contact.email else "dler.azeez@example.com")
+    country = (contact.country if contact and contact.country else "IQ")
+    city = (contact.city if contact and contact.city else "Erbil")
+    gender_text = "Female" if (p0.gender or "M").upper() == "F" else "Male"
+
+    return _FULFILLMENT_TMPL.format_map(
+        {
+            "first_name": _esc_text(p0.first_name),
+            "last_name": _esc_text(p0.last_name),
+            "email": _esc_text(email),
+            "country": _esc_text(country),
+            "gender": _esc_text(gender_text),
+            "city": _esc_text(city),
+            "phone": _esc_text(phone),
+            "nationality_num": _esc_text((p0.passport if passengers and p0.passport else "P12345678")),
         }
+    )
 
-    def _pricing(pi: dict) -> dict:
-        """Extract pricing in a tolerant way.
-
-        Supported shapes:
-          - priced itinerary (WINGS JSON): airItineraryPricingInfo.itinTotalFare[0].baseFare/totalFare
-          - normalized itinerary (frontend): total_currency + amount_raw / total_amount
-        """
-        # Normalized itinerary
-        if isinstance(pi, dict) and (pi.get("total_currency") or pi.get("amount_raw") or pi.get("total_amount")) and not pi.get("airItineraryPricingInfo"):
-            cur = str(pi.get("total_currency") or "IQD")
-            amt = pi.get("amount_raw")
-            if amt is None:
-                # total_amount is often string, keep numeric-ish characters
-                try:
-                    amt = float(str(pi.get("total_amount") or "").replace(",", "").strip() or 0)
-                except Exception:
-                    amt = 0
-            try:
-                amt_str = str(int(float(amt))) if float(amt).is_integer() else str(float(amt))
-            except Exception:
-                amt_str = str(amt or "")
-            return {
-                "baseCur": cur,
-                "baseDec": "2",
-                "baseAmt": amt_str,
-                "totCur": cur,
-                "totDec": "2",
-                "totAmt": amt_str,
-            }
 
-        # WINGS priced itinerary
-        itin_total = _as_list((pi.get("airItineraryPricingInfo") or {}).get("itinTotalFare"))
-        itin_total = itin_total[0] if itin_total else {}
-        base = itin_total.get("baseFare") or {}
-        total = itin_total.get("totalFare") or {}
+def _build_leg_xml(pi: dict, leg_index: int) -> str:
+    segs = _segments_from_pi(pi, leg_index)
+    if not segs:
+        return ""
+    seg_xml = []
+    for idx, seg in enumerate(segs, start=1):
+        dep_dt = seg.get("departureDateTime") or ""
+        arr_dt = seg.get("arrivalDateTime") or ""
+        flt_no = seg.get("flightNumber") or ""
+        dep_lc = ((seg.get("departureAirport") or {}).get("locationCode") or "").upper()
+        arr_lc = ((seg.get("arrivalAirport") or {}).get("locationCode") or "").upper()
+
+        op = seg.get("operatingAirline") or {}
+        mk = seg.get("marketingAirline") or {}
+        op_code = (op.get("code") or mk.get("code") or "IA").upper()
+        mk_code = (mk.get("code") or op_code).upper()
+        op_name = op.get("companyShortName") or "Iraqi Airways"
+        eq_type = _pick_equipment(seg)
+
+        tpa_any = _pick_tpa_any(seg)
+        dep_full = tpa_any.get("departureAirport") or tpa_any.get("DepartureAirport") or ""
+        arr_full = tpa_any.get("arrivalAirport") or tpa_any.get("ArrivalAirport") or ""
+        dep_country = tpa_any.get("departureCountry") or ""
+        arr_country = tpa_any.get("arrivalCountry") or ""
+        dep_city = tpa_any.get("departureCity") or ""
+        arr_city = tpa_any.get("arrivalCity") or ""
+        free_bag = tpa_any.get("freeBaggage") or ""
+        aircraft_name = tpa_any.get("aircraftName") or ""
+
+        seg_xml.append(
+            _FLIGHT_SEGMENT_TMPLS[bool(eq_type)].format_map(
+                {
+                    "dep_dt": _esc_attr(dep_dt),
+                    "arr_dt": _esc_attr(arr_dt),
+                    "rph": idx,
+                    "flt_no": _esc_attr(flt_no),
+                    "dep_lc": _esc_attr(dep_lc),
+                    "arr_lc": _esc_attr(arr_lc),
+                    "op_name": _esc_attr(op_name),
+                    "op_code": _esc_attr(op_code),
+                    "eq_type": _esc_attr(eq_type),
+                    "dep_full": _esc_text(dep_full),
+                    "dep_country": _esc_text(dep_country),
+                    "dep_city": _esc_text(dep_city),
+                    "arr_city": _esc_text(arr_city),
+                    "arr_full": _esc_text(arr_full),
+                    "arr_country": _esc_text(arr_country),
+                    "free_bag": _esc_text(free_bag),
+                    "aircraft_name": _esc_text(aircraft_name),
+                    "mk_code": _esc_attr(mk_code),
+                }
+            )
+        )
+    return "\n".join(seg_xml)
+
+
+def _build_airbook_xml(
+    outbound_pi: dict,
+    return_pi: dict | None,
+    passengers: list[Passenger],
+    contact: Contact | None,
+    trip_type: str,
+) -> str:
+    tv = _ticketing_vendor(outbound_pi)
+    if not (tv.get("companyShortName") and tv.get("code") and tv.get("codeContext")):
+        raise ValueError("TicketingVendor not found. Cannot book without vendor.")
+
+    pr = _pricing(outbound_pi)
+
+    # DirectionInd
+    direction = "OneWay" if (trip_type or "oneway").lower() != "roundtrip" else "Return"
+
+    # Build legs
+    out_leg = _build_leg_xml(outbound_pi, 0)
+    if not out_leg:
+        raise ValueError("No outbound segments found in itinerary.")
+
+    rt_leg = ""
+    if (trip_type or "").lower() == "roundtrip":
+        # Return PI may contain the return leg at index 0 if it was searched as 'reverse one-way'
+        # or at index 1 if it came from a roundtrip priced itinerary.
+        if return_pi:
+            rt_leg = _build_leg_xml(return_pi, 0) or _build_leg_xml(return_pi, 1)
+        else:
+            rt_leg = ""
 
-        # Fallbacks: if base missing, use total
-        if not isinstance(base, dict):
-            base = {}
-        if not isinstance(total, dict):
-            total = {}
+    traveler_xml = _build_air_travelers(passengers, contact)
+    fulfillment_xml = _build_fulfillment(passengers, contact)
 
-        if not base and total:
-            base = dict(total)
+    # Price section: keep BaseFare + TotalFare like your working XML
+    base_amt = pr.get("baseAmt") or pr.get("totAmt") or ""
+    tot_amt = pr.get("totAmt") or pr.get("baseAmt") or ""
 
-        def _f(n):
-            try:
-                return str(n)
-            except Exception:
-                return ""
+    parts = [_AIRBOOK_HEAD_TMPL.format_map({"direction": direction})]
+    parts += (_AIRBOOK_ODO_OPEN, out_leg, _AIRBOOK_ODO_CLOSE)
+    if rt_leg:
+        parts += (_AIRBOOK_ODO_OPEN, rt_leg, _AIRBOOK_ODO_CLOSE)
+    parts.append(
+        _AIRBOOK_PRICE_TMPL.format_map(
+            {
+                "base_cur_dec": _cur_dec_attrs(pr.get("baseCur") or "IQD", pr.get("baseDec") or "2"),
+                "base_amt": _esc_attr(base_amt),
+                "tot_cur_dec": _cur_dec_attrs(pr.get("totCur") or "IQD", pr.get("totDec") or "2"),
+                "tot_amt": _esc_attr(tot_amt),
+            }
+        )
+    )
+    parts += (traveler_xml, _AIRBOOK_TRAVELERS_CLOSE, fulfillment_xml)
+    parts.append(
+        _AIRBOOK_TICKETING_TMPL.format_map(
+            {"tv_attrs": _ticketing_vendor_attrs(tv.get("companyShortName"), tv.get("code"), tv.get("codeContext"))}
+        )
+    )
+    return "".join(parts)
 
-        return {
-            "baseCur": _f(base.get("currencyCode") or total.get("currencyCode") or "IQD"),
-            "baseDec": _f(base.get("decimalPlaces") or total.get("decimalPlaces") or "2"),
-            "baseAmt": _f(base.get("amount") or ""),
-            "totCur": _f(total.get("currencyCode") or base.get("currencyCode") or "IQD"),
-            "totDec": _f(total.get("decimalPlaces") or base.get("decimalPlaces") or "2"),
-            "totAmt": _f(total.get("amount") or ""),
-        }
 
-    def _segments_from_pi(pi: dict, leg_index: int) -> list[dict]:
-        """Return a list of segment dicts in WINGS-like structure.
+def _parse_xml(xml_text: str):
+    if _LET is not None:
+        # lxml won't take a str that carries an encoding declaration; hand it bytes.
+        return _LET.fromstring(xml_text.encode("utf-8"), _XML_PARSER)
+    return ET.fromstring(xml_text)
 
-        Accepts either:
-          1) WINGS priced itinerary dict (airItinerary.originDestinationOptions.originDestinationOption[].flightSegment[])
-          2) normalized itinerary dict (segments[] with dep/arr/dep_dt/arr_dt/flight/airline/airline_name/equipment/baggage/aircraft)
-        """
-        # Case 1: WINGS priced itinerary shape (already supported)
-        odo_list = _as_list(
-            ((pi.get("airItinerary") or {}).get("originDestinationOptions") or {}).get("originDestinationOption")
-        )
-        if odo_list and leg_index < len(odo_list):
-            segs = _as_list((odo_list[leg_index] or {}).get("flightSegment"))
-            return [s for s in segs if isinstance(s, dict)]
 
-        # Case 1b: capitalization variants
-        odo_list2 = _as_list(
-            ((pi.get("AirItinerary") or {}).get("OriginDestinationOptions") or {}).get("OriginDestinationOption")
-        )
-        if odo_list2 and leg_index < len(odo_list2):
-            segs = _as_list((odo_list2[leg_index] or {}).get("FlightSegment"))
-            return [s for s in segs if isinstance(s, dict)]
-
-        # Case 2: normalized itinerary
-        segs_norm = pi.get("segments")
-        if isinstance(segs_norm, list):
-            if leg_index != 0:
-                return []
-            out: list[dict] = []
-            for s in segs_norm:
-                if not isinstance(s, dict):
-                    continue
-                dep = (s.get("dep") or "").upper()
-                arr = (s.get("arr") or "").upper()
-                dep_dt = s.get("dep_dt") or ""
-                arr_dt = s.get("arr_dt") or ""
-                flt = s.get("flight") or ""
-                airline = (s.get("airline") or "")
-                airline_name = (s.get("airline_name") or "")
-                equip = s.get("equipment") or ""
-                baggage = s.get("baggage") or ""
-                aircraft = s.get("aircraft") or ""
-
-                seg = {
-                    "departureDateTime": dep_dt,
-                    "arrivalDateTime": arr_dt,
-                    "flightNumber": flt,
-                    "departureAirport": {"locationCode": dep},
-                    "arrivalAirport": {"locationCode": arr},
-                    "operatingAirline": {"code": airline, "companyShortName": airline_name},
-                    "marketingAirline": {"code": airline},
-                    "equipment": {"airEquipType": equip} if equip else {},
-                    "tpaextensions": {"any": [{"freeBaggage": baggage, "aircraftName": aircraft}]},
-                }
-                out.append(seg)
-            return out
-
-        return []
-
-    def _build_air_travelers(passengers: list[Passenger], contact: Contact | None) -> str:
-        # Provide contact + document defaults if missing.
-        default_phone = (contact.phone if contact and contact.phone else "9647500000000")
-        default_email = (contact.email if contact and contact.email else "dler.azeez@example.com")
-        default_issue = (contact.country if contact and contact.country else "IQ")
-        default_nation = default_issue
-
-        def _doc_for(i: int, p: Passenger) -> dict:
-            # Generate a reasonably unique fallback passport if not supplied.
-            passport = p.passport or ("P" + "".join([str((i + 7) % 10) for _ in range(8)]))
-            issue = (p.issue_country or default_issue)[:2].upper()
-            nation = (p.nationality or default_nation)[:2].upper()
-            exp = p.expire_date or "2030-01-01"
-            doc_type = p.doc_type or "2"
-            return {"passport": passport, "issue": issue, "nation": nation, "exp": exp, "doc_type": doc_type}
-
-        chunks = []
-        for i, p in enumerate(passengers):
-            doc = _doc_for(i, p)
-            # Only first traveler carries contact fields (keeps XML closer to common OTA patterns)
-            tel_xml = f'      <Telephone PhoneNumber="{_esc_attr(default_phone)}"/>\n' if i == 0 else ""
-            email_xml = f"      <Email>{_esc_text(default_email)}</Email>\n" if i == 0 else ""
-
-            chunks.append(
-                f'''    <AirTraveler BirthDate="{_esc_attr(p.birth_date)}" PassengerTypeCode="{_esc_attr(p.pax_type)}" AccompaniedByInfantInd="false" Gender="{_esc_attr(p.gender or "M")}">
-      <PersonName>
-        <NamePrefix>{_esc_text(p.name_prefix or ("MS" if (p.gender or "M").upper()=="F" else "MR"))}</NamePrefix>
-        <GivenName>{_esc_text(p.first_name)}</GivenName>
-        <Surname>{_esc_text(p.last_name)}</Surname>
-      </PersonName>
+def _extract_refs(xml_text: str) -> dict:
+    # Try XML parse first
+    try:
+        root = _parse_xml(xml_text)
+        if _BOOKREF_XPATH is not None:
+            refs = _BOOKREF_XPATH(root)
+        else:
+            # `{*}` matches the tag in any (or no) namespace.
+            refs = root.iterfind(".//{*}BookingReferenceID")
+        pairs = [(br.get("ID"), br.get("ID_Context")) for br in refs]
+    except Exception:
+        pairs = []
+    if not pairs:
+        # Regex fallback (same fields as the XML path). Also runs when lxml's recovering
+        # parser returned a tree that lost the references in broken markup.
+        for m in _BOOKREF_TAG_RE.finditer(xml_text or ""):
+            attrs = dict(_BOOKREF_ATTR_RE.findall(m.group(1)))
+            pairs.append((attrs.get("ID"), attrs.get("ID_Context")))
 
-{tel_xml}{email_xml}      <Document DocID="{_esc_attr(doc["passport"])}"
-                DocType="{_esc_attr(doc["doc_type"])}"
-                DocIssueCountry="{_esc_attr(doc["issue"])}"
-                DocHolderNationality="{_esc_attr(doc["nation"])}"
-                ExpireDate="{_esc_attr(doc["exp"])}"/>
-    </AirTraveler>'''
-            )
-        return "\n".join(chunks)
+    pnr = None
+    connectota = None
+    for val, ctx in pairs:
+        if val and not pnr:
+            pnr = val
+        if ctx and ctx.lower() == "connectota":
+            connectota = val
 
-    def _build_fulfillment(passengers: list[Passenger], contact: Contact | None) -> str:
-        p0 = passengers[0] if passengers else Passenger(first_name="Test", last_name="User", birth_date="1990-01-01")
-        phone = (contact.phone if contact and contact.phone else "9647500000000")
-        email = (contact.email if contact and contact.email else "dler.azeez@example.com")
-        country = (contact.country if contact and contact.country else "IQ")
-        city = (contact.city if contact and contact.city else "Erbil")
-        gender_text = "Female" if (p0.gender or "M").upper() == "F" else "Male"
+    return {"pnr": pnr, "connectota_id": connectota}
 
-        return f'''  <Fulfillment>
-    <Name>
-      <GivenName>{_esc_text(p0.first_name)}</GivenName>
-      <Surname>{_esc_text(p0.last_name)}</Surname>
-      <TPA_Extensions>
-        <TPA_Extension>
-          <Username>{_esc_text(email)}</Username>
-          <Country>{_esc_text(country)}</Country>
-          <PersianLasttName>{_esc_text(p0.last_name)}</PersianLasttName>
-          <Gender>{_esc_text(gender_text)}</Gender>
-          <City>{_esc_text(city)}</City>
-          <PersianFirstName>{_esc_text(p0.first_name)}</PersianFirstName>
-          <Mobile>{_esc_text(phone)}</Mobile>
-          <Nationality>{_esc_text(country)}</Nationality>
-          <NationalityNum>{_esc_text((passengers[0].passport if passengers and passengers[0].passport else "P12345678"))}</NationalityNum>
-        </TPA_Extension>
-      </TPA_Extensions>
-    </Name>
-  </Fulfillment>'''
 
-    def _build_leg_xml(pi: dict, leg_index: int) -> str:
-        segs = _segments_from_pi(pi, leg_index)
-        if not segs:
-            return ""
-        seg_xml = []
-        for idx, seg in enumerate(segs, start=1):
-            dep_dt = seg.get("departureDateTime") or ""
-            arr_dt = seg.get("arrivalDateTime") or ""
-            flt_no = seg.get("flightNumber") or ""
-            dep_lc = ((seg.get("departureAirport") or {}).get("locationCode") or "").upper()
-            arr_lc = ((seg.get("arrivalAirport") or {}).get("locationCode") or "").upper()
-
-            op = seg.get("operatingAirline") or {}
-            mk = seg.get("marketingAirline") or {}
-            op_code = (op.get("code") or mk.get("code") or "IA").upper()
-            mk_code = (mk.get("code") or op_code).upper()
-            op_name = op.get("companyShortName") or "Iraqi Airways"
-            eq_type = _pick_equipment(seg)
-
-            tpa_any = _pick_tpa_any(seg)
-            dep_full = tpa_any.get("departureAirport") or tpa_any.get("DepartureAirport") or ""
-            arr_full = tpa_any.get("arrivalAirport") or tpa_any.get("ArrivalAirport") or ""
-            dep_country = tpa_any.get("departureCountry") or ""
-            arr_country = tpa_any.get("arrivalCountry") or ""
-            dep_city = tpa_any.get("departureCity") or ""
-            arr_city = tpa_any.get("arrivalCity") or ""
-            free_bag = tpa_any.get("freeBaggage") or ""
-            aircraft_name = tpa_any.get("aircraftName") or ""
-
-            equipment_xml = f'          <Equipment AirEquipType="{_esc_attr(eq_type)}"/>\n' if eq_type else ""
-
-            seg_xml.append(
-                f'''        <FlightSegment DepartureDateTime="{_esc_attr(dep_dt)}"
-                       ArrivalDateTime="{_esc_attr(arr_dt)}"
-                       StopQuantity="0"
-                       RPH="{idx}"
-                       FlightNumber="{_esc_attr(flt_no)}">
-          <DepartureAirport LocationCode="{_esc_attr(dep_lc)}"/>
-          <ArrivalAirport LocationCode="{_esc_attr(arr_lc)}"/>
-          <OperatingAirline CompanyShortName="{_esc_attr(op_name)}" Code="{_esc_attr(op_code)}"/>
-{equipment_xml}          <TPA_Extensions>
-            <TPA_Extension>
-              <DepartureAirport>{_esc_text(dep_full)}</DepartureAirport>
-              <departureCountry>{_esc_text(dep_country)}</departureCountry>
-              <departureCity>{_esc_text(dep_city)}</departureCity>
-              <arrivalCity>{_esc_text(arr_city)}</arrivalCity>
-              <ArrivalAirport>{_esc_text(arr_full)}</ArrivalAirport>
-              <arrivalCountry>{_esc_text(arr_country)}</arrivalCountry>
-              <freeBaggage>{_esc_text(free_bag)}</freeBaggage>
-              <aircraftName>{_esc_text(aircraft_name)}</aircraftName>
-            </TPA_Extension>
-          </TPA_Extensions>
-          <MarketingAirline Code="{_esc_attr(mk_code)}"/>
-        </FlightSegment>'''
-            )
-        return "\n".join(seg_xml)
-
-    def _build_airbook_xml(
-        outbound_pi: dict,
-        return_pi: dict | None,
-        passengers: list[Passenger],
-        contact: Contact | None,
-        trip_type: str,
-    ) -> str:
-        tv = _ticketing_vendor(outbound_pi)
-        if not (tv.get("companyShortName") and tv.get("code") and tv.get("codeContext")):
-            raise ValueError("TicketingVendor not found. Cannot book without vendor.")
-
-        pr = _pricing(outbound_pi)
-
-        # DirectionInd
-        direction = "OneWay" if (trip_type or "oneway").lower() != "roundtrip" else "Return"
-
-        # Build legs
-        out_leg = _build_leg_xml(outbound_pi, 0)
-        if not out_leg:
-            raise ValueError("No outbound segments found in itinerary.")
-
-        rt_leg = ""
-        if (trip_type or "").lower() == "roundtrip":
-            # Return PI may contain the return leg at index 0 if it was searched as 'reverse one-way'
-            # or at index 1 if it came from a roundtrip priced itinerary.
-            if return_pi:
-                rt_leg = _build_leg_xml(return_pi, 0) or _build_leg_xml(return_pi, 1)
-            else:
-                rt_leg = ""
-
-        traveler_xml = _build_air_travelers(passengers, contact)
-        fulfillment_xml = _build_fulfillment(passengers, contact)
-
-        # Price section: keep BaseFare + TotalFare like your working XML
-        base_amt = pr.get("baseAmt") or pr.get("totAmt") or ""
-        tot_amt = pr.get("totAmt") or pr.get("baseAmt") or ""
-
-        xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<OTA_AirBookRQ>
+def _new_pending_id() -> str:
+    """PND- plus 10 uppercase hex chars, the same shape as the old uuid4().hex[:10] ids."""
+    return "PND-" + token_hex(5).upper()
 
-  <AirItinerary DirectionInd="{_esc_attr(direction)}">
-    <OriginDestinationOptions>
-      <OriginDestinationOption>
-{out_leg}
-      </OriginDestinationOption>'''
 
-        if rt_leg:
-            xml += f'''
-      <OriginDestinationOption>
-{rt_leg}
-      </OriginDestinationOption>'''
+# AirBook request/response XML is kept out of the /api/book body (pass ?debug=true to get it
+# inline). It carries passenger PII, so it is only written when BOOKING_AUDIT_DIR names a data
+# directory outside the services package; files are owner-only, looked up by the audit_id in the
+# response, and pruned once older than BOOKING_AUDIT_RETENTION_DAYS.
+_SERVICES_DIR = Path(__file__).resolve().parents[2]
 
-        xml += f'''
-    </OriginDestinationOptions>
-  </AirItinerary>
 
-  <PriceInfo>
-    <ItinTotalFare>
-      <BaseFare CurrencyCode="{_esc_attr(pr.get("baseCur") or "IQD")}" DecimalPlaces="{_esc_attr(pr.get("baseDec") or "2")}" Amount="{_esc_attr(base_amt)}"/>
-      <TotalFare CurrencyCode="{_esc_attr(pr.get("totCur") or "IQD")}" DecimalPlaces="{_esc_attr(pr.get("totDec") or "2")}" Amount="{_esc_attr(tot_amt)}"/>
-    </ItinTotalFare>
-  </PriceInfo>
+def _booking_audit_dir() -> Path | None:
+    raw = (os.getenv("BOOKING_AUDIT_DIR") or "").strip()
+    if not raw:
+        return None
+    path = Path(raw).resolve()
+    if path == _SERVICES_DIR or _SERVICES_DIR in path.parents:
+        logger.warning("BOOKING_AUDIT_DIR %s is inside the services package; booking audit disabled", path)
+        return None
+    return path
 
-  <TravelerInfo>
-{traveler_xml}
-  </TravelerInfo>
 
-{fulfillment_xml}
+_BOOKING_AUDIT_DIR = _booking_audit_dir()
+_BOOKING_AUDIT_RETENTION_SEC = float(os.getenv("BOOKING_AUDIT_RETENTION_DAYS") or 30) * 86400
+_BOOKING_AUDIT_PRUNE_EVERY_SEC = 3600
+_AUDIT_PRUNE_STATE = {"last": 0.0}
+# Strong refs so pending audit writes aren't garbage-collected mid-flight.
+_AUDIT_TASKS: set[asyncio.Task] = set()
 
-  <Ticketing>
-    <TicketingVendor CompanyShortName="{_esc_attr(tv.get("companyShortName"))}" Code="{_esc_attr(tv.get("code"))}" CodeContext="{_esc_attr(tv.get("codeContext"))}"/>
-  </Ticketing>
 
-</OTA_AirBookRQ>
-'''
-        return xml
+def _write_private(path: Path, text: str) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+
 
-    def _extract_refs(xml_text: str) -> dict:
-        # Try XML parse first
-        pnr = None
-        connectota = None
+def _prune_booking_audit(audit_dir: Path, now: float) -> None:
+    cutoff = now - _BOOKING_AUDIT_RETENTION_SEC
+    for path in audit_dir.glob("*.xml"):
         try:
-            root = _ET.fromstring(xml_text)
-            for br in root.findall(".//BookingReferenceID"):
-                if br is None:
-                    continue
-                val = br.attrib.get("ID")
-                ctx = br.attrib.get("ID_Context")
-                if val and not pnr:
-                    pnr = val
-                if ctx and ctx.lower() == "connectota":
-                    connectota = val
-        except Exception:
-            # Regex fallback
-            m = _re.search(r'<BookingReferenceID[^>]*\sID="([^"]+)"', xml_text or "")
-            if m:
-                pnr = m.group(1)
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
 
-        return {"pnr": pnr, "connectota_id": connectota}
 
-    # -----------------------------
-    # Parse input priced itineraries
-    # -----------------------------
+def _write_booking_audit(audit_dir: Path, audit_id: str, request_xml: str, response_xml: str) -> None:
     try:
-        outbound_pi = _json.loads(req.outbound_itinerary_json)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid outbound_itinerary_json: {e}")
-
-    return_pi = None
-    if req.return_itinerary_json:
+        audit_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        _write_private(audit_dir / f"{audit_id}.request.xml", request_xml)
+        _write_private(audit_dir / f"{audit_id}.response.xml", response_xml)
+    except OSError:
+        logger.exception("Could not write booking audit %s", audit_id)
+        return
+
+    now = time.time()
+    if now - _AUDIT_PRUNE_STATE["last"] >= _BOOKING_AUDIT_PRUNE_EVERY_SEC:
+        _AUDIT_PRUNE_STATE["last"] = now
         try:
-            return_pi = _json.loads(req.return_itinerary_json)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid return_itinerary_json: {e}")
+            _prune_booking_audit(audit_dir, now)
+        except OSError:
+            logger.exception("Could not prune booking audit directory %s", audit_dir)
+
+
+def _schedule_booking_audit(request_xml: str, response_xml: str) -> str | None:
+    """Write the AirBook exchange in the background; returns its audit_id, or None when disabled."""
+    if _BOOKING_AUDIT_DIR is None:
+        return None
+    audit_id = uuid4().hex
+    task = asyncio.create_task(
+        run_in_threadpool(_write_booking_audit, _BOOKING_AUDIT_DIR, audit_id, request_xml, response_xml)
+    )
+    _AUDIT_TASKS.add(task)
+    task.add_done_callback(_AUDIT_TASKS.discard)
+    return audit_id
+
+
+@router.post("/api/book")
+async def book(req: BookingRequest, debug: bool = False, http: httpx.AsyncClient = Depends(get_http)):
+    client = get_client_from_env()
+    if not client or _wings_config_missing():
+        return FastJSONResponse(
+            {
+                "error": (
+                    "WINGS credentials not configured. "
+                    "Set WINGS_AUTH_TOKEN (or AUTH_TOKEN) and optionally "
+                    "WINGS_BASE_URL/SEARCH_URL/BOOK_URL."
+                )
+            },
+            status_code=500,
+        )
+
+    # Provider permissions / filters
+    pol = _ota_policy()
+    if not pol["availability"]:
+        return FastJSONResponse({"meta": {"disabled": True, "reason": "Provider OTA is disabled"}, "results_outbound": []})
+
+    # If ticketing is not effective (permissions set to availability-only or schedule disables ticketing),
+    # return a pending response so the frontend can queue it in Pending bookings.
+    if not pol.get("ticketing_effective", True):
+        pending_id = _new_pending_id()
+        return FastJSONResponse(
+            {
+                "pending": True,
+                "status": "pending",
+                "pending_id": pending_id,
+                "provider": "OTA",
+                "reason": "Ticketing is disabled by permissions or schedule.",
+            }
+        )
+
+    # -----------------------------
+    # Input priced itineraries (decoded during request validation)
+    # -----------------------------
+    outbound_pi = req.outbound_itinerary_json
+    return_pi = req.return_itinerary_json
 
     if not req.passengers:
         raise HTTPException(status_code=400, detail="passengers is required")
 
     # Build + book
     try:
-        airbook_xml = _build_airbook_xml(
+        # Pure-Python string building over every passenger/segment: keep it off the event loop.
+        airbook_xml = await run_in_threadpool(
+            _build_airbook_xml,
             outbound_pi=outbound_pi,
             return_pi=return_pi,
             passengers=req.passengers,
             contact=req.contact,
             trip_type=req.trip_type,
         )
-        airbook_resp = await client.air_book(airbook_xml)
+        airbook_resp = await client.air_book(airbook_xml, http)
         refs = _extract_refs(airbook_resp)
-        return JSONResponse(
-            {
-                "status": "success",
-                "pnr": refs.get("pnr"),
-                "connectota_id": refs.get("connectota_id"),
-                "request_xml": airbook_xml,
-                "response_xml": airbook_resp,
-            }
-        )
+        out = {
+            "status": "success",
+            "pnr": refs.get("pnr"),
+            "connectota_id": refs.get("connectota_id"),
+            "audit_id": _schedule_booking_audit(airbook_xml, airbook_resp),
+        }
+        if debug:
+            out["request_xml"] = airbook_xml
+            out["response_xml"] = airbook_resp
+        return FastJSONResponse(out)
     except httpx.HTTPStatusError:
         # When ticketing fails (e.g. provider offline), return a pending response so it can be completed manually.
-        from uuid import uuid4
-        pending_id = "PND-" + uuid4().hex[:10].upper()
-        return JSONResponse(
+        pending_id = _new_pending_id()
+        return FastJSONResponse(
             {
                 "pending": True,
                 "status": "pending",
@@ -884,9 +1152,8 @@ async def book(req: BookingRequest):
             status_code=202,
         )
     except Exception:
-        from uuid import uuid4
-        pending_id = "PND-" + uuid4().hex[:10].upper()
-        return JSONResponse(
+        pending_id = _new_pending_id()
+        return FastJSONResponse(
             {
                 "pending": True,
                 "status": "pending",
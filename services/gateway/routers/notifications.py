@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
+from services.gateway.responses import FastJSONResponse
 from services.notifications.email.service import send_email
 
 router = APIRouter()
@@ -19,5 +19,5 @@ class EmailRequest(BaseModel):
 def notify_email(req: EmailRequest):
     ok, msg = send_email(req.to_email, req.subject, req.body)
     if ok:
-        return {"status": "ok"}
-    return JSONResponse(status_code=500, content={"status": "error", "error": msg})
+        return FastJSONResponse({"status": "ok"})
+    return FastJSONResponse(status_code=500, content={"status": "error", "error": msg})
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 
+from services.gateway.http_client import get_http
+from services.gateway.responses import FastJSONResponse
 from services.payments.fib.service import (
-    create_payment as fib_create_payment,
+    create_payment_async as fib_create_payment,
     load_config as load_fib_config,
     save_config as save_fib_config,
 )
@@ -13,26 +17,27 @@ router = APIRouter()
 
 @router.get("/api/other-apis/fib")
 async def fib_config_get():
-    return load_fib_config()
+    return FastJSONResponse(load_fib_config())
 
 
 @router.post("/api/other-apis/fib")
 async def fib_config_set(payload: dict):
     try:
-        cfg = save_fib_config(payload or {})
-        return cfg
+        # Serialize + write config.json on a worker thread, not the event loop.
+        cfg = await run_in_threadpool(save_fib_config, payload or {})
+        return FastJSONResponse(cfg)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/api/other-apis/fib/create-payment")
-async def fib_create_payment_endpoint(payload: dict):
+async def fib_create_payment_endpoint(payload: dict, http: httpx.AsyncClient = Depends(get_http)):
     try:
         amount = int(payload.get("amount") or 0)
         if amount <= 0:
             raise ValueError("Amount must be greater than 0.")
         description = payload.get("description") or "Payment"
-        data = fib_create_payment(amount, description)
-        return data
+        data = await fib_create_payment(amount, description, http)
+        return FastJSONResponse(data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,28 +1,31 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
 
 from services.gateway.permissions_store import (
-    _compute_schedule_windows,
     _load_permissions,
     _save_permissions,
-    _ticketing_schedule_allows,
+    _schedule_status,
+    _self_blocked_providers,
 )
+from services.gateway.responses import FastJSONResponse
 
 router = APIRouter()
 
 
 @router.get("/api/permissions")
 async def get_permissions():
-    return _load_permissions()
+    return FastJSONResponse(_load_permissions())
 
 
 @router.post("/api/permissions")
 async def set_permissions(payload: dict):
     try:
         # Keep it simple: accept full object and write it.
-        cfg = _save_permissions(payload or {})
-        return cfg
+        # Serialize + write permissions.json on a worker thread, not the event loop.
+        cfg = await run_in_threadpool(_save_permissions, payload or {})
+        return FastJSONResponse(cfg)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -31,25 +34,22 @@ async def set_permissions(payload: dict):
 async def permissions_status():
     cfg = _load_permissions()
     providers = cfg.get("providers") or {}
+    self_blocked = _self_blocked_providers(cfg)
     out = {}
     for code, p in providers.items():
         if not isinstance(p, dict):
             continue
-        availability = bool(p.get("availability_enabled", True))
-        blocked_suppliers = p.get("blocked_suppliers") or []
-        if str(code) in [str(x).strip() for x in blocked_suppliers]:
-            availability = False
+        code = str(code)
+        availability = bool(p.get("availability_enabled", True)) and code not in self_blocked
 
         ticketing_mode = (p.get("ticketing_mode") or "full").strip().lower()
-        schedule_cfg = p.get("ticketing_schedule") or {}
-        schedule_ok = _ticketing_schedule_allows(schedule_cfg)
+        schedule_ok, schedule_info = _schedule_status(p.get("ticketing_schedule") or {})
         ticketing_effective = availability and (ticketing_mode == "full") and schedule_ok
-        schedule_info = _compute_schedule_windows(schedule_cfg)
-        out[str(code)] = {
+        out[code] = {
             "availability": availability,
             "ticketing_mode": "full" if ticketing_mode == "full" else "availability_only",
             "ticketing_schedule_ok": schedule_ok,
             "ticketing_effective": ticketing_effective,
             "schedule": schedule_info,
         }
-    return {"providers": out}
+    return FastJSONResponse({"providers": out})
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import os
-import subprocess
+import queue
+import smtplib
+import ssl
+from urllib.parse import urlsplit
 
 
 SMTP_URL = os.getenv("SMTP_URL") or "smtps://smtppro.zoho.com:465"
@@ -9,9 +12,47 @@ SMTP_USER = os.getenv("SMTP_USER") or "dler@corevia-consultants.com"
 SMTP_PASS = os.getenv("SMTP_PASS") or "p1tEuc41NDDB"
 SMTP_FROM = os.getenv("SMTP_FROM") or SMTP_USER
 
+SMTP_TIMEOUT_SEC = 25
+
+# Idle authenticated connections, reused across sends to skip the TLS handshake and AUTH.
+# Extra connections opened during a burst are closed instead of pooled.
+_SMTP_POOL: queue.LifoQueue[smtplib.SMTP] = queue.LifoQueue(maxsize=4)
+_SSL_CONTEXT = ssl.create_default_context()
+
+
+def _connect() -> smtplib.SMTP:
+    """Open and authenticate a connection for SMTP_URL (smtps:// is implicit TLS, else STARTTLS)."""
+    url = urlsplit(SMTP_URL)
+    host = url.hostname or "localhost"
+    if url.scheme == "smtps":
+        conn = smtplib.SMTP_SSL(host, url.port or 465, timeout=SMTP_TIMEOUT_SEC, context=_SSL_CONTEXT)
+    else:
+        conn = smtplib.SMTP(host, url.port or 587, timeout=SMTP_TIMEOUT_SEC)
+        conn.starttls(context=_SSL_CONTEXT)
+    try:
+        conn.login(SMTP_USER, SMTP_PASS)
+    except Exception:
+        _discard(conn)
+        raise
+    return conn
+
+
+def _discard(conn: smtplib.SMTP) -> None:
+    try:
+        conn.quit()
+    except Exception:
+        conn.close()
+
+
+def _release(conn: smtplib.SMTP) -> None:
+    try:
+        _SMTP_POOL.put_nowait(conn)
+    except queue.Full:
+        _discard(conn)
+
 
 def send_email(to_email: str, subject: str, body: str) -> tuple[bool, str]:
-    """Send email using a simple SMTP curl command."""
+    """Send email over a pooled SMTP connection."""
     to_email = (to_email or "").strip()
     if not to_email:
         return False, "Missing recipient email"
@@ -19,40 +60,39 @@ def send_email(to_email: str, subject: str, body: str) -> tuple[bool, str]:
     if not SMTP_USER or not SMTP_PASS:
         return False, "SMTP credentials are missing"
 
-    cmd = [
-        "curl",
-        "--url",
-        SMTP_URL,
-        "--ssl-reqd",
-        "--user",
-        f"{SMTP_USER}:{SMTP_PASS}",
-        "--mail-from",
-        SMTP_FROM,
-        "--mail-rcpt",
-        to_email,
-        "-T",
-        "-",
-    ]
-
     msg = (
         f"From: {SMTP_FROM}\n"
         f"To: {to_email}\n"
         f"Subject: {subject}\n\n"
         f"{body}\n"
-    )
+    ).encode("utf-8")
 
     try:
-        res = subprocess.run(
-            cmd,
-            input=msg.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=25,
-        )
-        if res.returncode == 0:
-            return True, "sent"
-        err = (res.stderr or res.stdout or b"").decode("utf-8", errors="ignore").strip()
-        return False, err or f"curl failed (code {res.returncode})"
+        conn = _SMTP_POOL.get_nowait()
+        pooled = True
+    except queue.Empty:
+        conn, pooled = None, False
+
+    try:
+        if conn is None:
+            conn = _connect()
+        try:
+            conn.sendmail(SMTP_FROM, [to_email], msg)
+        except smtplib.SMTPServerDisconnected:
+            if not pooled:
+                raise
+            # The server dropped the idle connection; retry once on a fresh one.
+            conn.close()
+            conn = _connect()
+            conn.sendmail(SMTP_FROM, [to_email], msg)
+    except smtplib.SMTPRecipientsRefused as exc:
+        # Session is still healthy; only this recipient was rejected.
+        _release(conn)
+        return False, str(exc)
     except Exception as exc:
+        if conn is not None:
+            _discard(conn)
         return False, str(exc)
 
+    _release(conn)
+    return True, "sent"
@@ -1,26 +1,106 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import atexit
 import os
+import threading
 import time
 from pathlib import Path
 
 import httpx
 
+from packages.utils.common import HTTP2, atomic_write, json_dumps, json_loads
 
 CONFIG_PATH = Path(__file__).resolve().parent / "config.json"
 
+# Saves run on worker threads; one at a time, each replacing config.json atomically.
+_SAVE_LOCK = threading.Lock()
+
+# Parsed config.json, reused while the file's (mtime, size) is unchanged. "index" pairs the
+# cached dict with its accounts keyed by id, swapped together so readers never see them mismatched.
+_CONFIG_CACHE: dict = {"stamp": None, "data": None, "index": None}
+
+# Client-credentials tokens: (account id, client id, base url) -> (token, expires_at).
+# Entries are treated as stale TOKEN_EXPIRY_MARGIN_SEC before FIB's expires_in runs out.
+_TOKEN_CACHE: dict[tuple[str, str, str], tuple[str, float]] = {}
+# Token fetches are serialized per cache key, so one slow upstream call only holds up callers
+# for the same account. _TOKEN_LOCK guards creation of the per-key thread locks.
+_TOKEN_LOCK = threading.Lock()
+_TOKEN_LOCKS: dict[tuple[str, str, str], threading.Lock] = {}
+_ASYNC_TOKEN_LOCKS: dict[tuple[str, str, str], asyncio.Lock] = {}
+TOKEN_EXPIRY_MARGIN_SEC = 30
+
+REQUEST_TIMEOUT_SEC = 20
+
+# Shared client: token and payment calls go to the same host, so the TLS session is reused.
+_CLIENT: httpx.Client | None = None
+
+
+def _get_client() -> httpx.Client:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.Client(
+            http2=HTTP2,
+            timeout=REQUEST_TIMEOUT_SEC,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+    return _CLIENT
+
+
+@atexit.register
+def _close_client() -> None:
+    if _CLIENT is not None:
+        _CLIENT.close()
+
+
+# Async twin for the gateway's event loop; the sync client above stays for non-ASGI callers.
+_ASYNC_CLIENT: httpx.AsyncClient | None = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None or _ASYNC_CLIENT.is_closed:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=REQUEST_TIMEOUT_SEC,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+    return _ASYNC_CLIENT
+
+
+async def aclose_http_client() -> None:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.aclose()
+        _ASYNC_CLIENT = None
+
+
+def _index_accounts(accounts: list) -> dict[str, dict]:
+    """Accounts keyed by str(id); the first account wins if an id repeats."""
+    by_id: dict[str, dict] = {}
+    for a in accounts:
+        if isinstance(a, dict):
+            by_id.setdefault(str(a.get("id")), a)
+    return by_id
+
 
 def load_config() -> dict:
+    """Load the FIB config; cached until the file changes, so treat the result as read-only."""
     try:
-        if CONFIG_PATH.exists():
-            data = json.loads(CONFIG_PATH.read_text(encoding="utf-8") or "{}")
-            if isinstance(data, dict):
-                if not isinstance(data.get("accounts"), list):
-                    data["accounts"] = []
-                if "active_account_id" not in data:
-                    data["active_account_id"] = ""
-                return data
+        st = CONFIG_PATH.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        if _CONFIG_CACHE["data"] is not None and _CONFIG_CACHE["stamp"] == stamp:
+            return _CONFIG_CACHE["data"]
+        data = json_loads(CONFIG_PATH.read_bytes() or b"{}")
+        if isinstance(data, dict):
+            if not isinstance(data.get("accounts"), list):
+                data["accounts"] = []
+            if "active_account_id" not in data:
+                data["active_account_id"] = ""
+            _CONFIG_CACHE["stamp"] = stamp
+            _CONFIG_CACHE["data"] = data
+            _CONFIG_CACHE["index"] = (data, _index_accounts(data["accounts"]))
+            return data
     except Exception:
         pass
     return {"accounts": [], "active_account_id": ""}
@@ -55,20 +135,26 @@ def save_config(cfg: dict) -> dict:
         active = norm_accounts[0].get("id") if norm_accounts else ""
     else:
         active = str(raw_active).strip()
-        if active and not any(a.get("id") == active for a in norm_accounts):
+        if active and active not in {a["id"] for a in norm_accounts}:
             active = ""
     cfg["active_account_id"] = active
 
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    CONFIG_PATH.write_text(json.dumps(cfg, indent=2, ensure_ascii=False), encoding="utf-8")
+    data = json_dumps(cfg, indent=True)
+    with _SAVE_LOCK:
+        atomic_write(CONFIG_PATH, data)
+        _CONFIG_CACHE["stamp"] = None
+        _CONFIG_CACHE["data"] = None
+        _CONFIG_CACHE["index"] = None
     return cfg
 
 
 def _get_active_account() -> dict:
     cfg = load_config()
-    accounts = cfg.get("accounts") or []
+    index = _CONFIG_CACHE["index"]
+    by_id = index[1] if index is not None and index[0] is cfg else _index_accounts(cfg.get("accounts") or [])
     active_id = str(cfg.get("active_account_id") or "").strip()
-    account = next((a for a in accounts if str(a.get("id")) == active_id), None)
+    account = by_id.get(active_id)
 
     env_base = os.getenv("FIB_BASE_URL") or ""
     env_client_id = os.getenv("FIB_CLIENT_ID") or ""
@@ -92,34 +178,88 @@ def _get_active_account() -> dict:
     return account
 
 
-def _get_access_token(account: dict) -> str:
+def _token_cache_key(account: dict, base_url: str) -> tuple[str, str, str]:
+    return (str(account.get("id") or ""), str(account.get("client_id") or ""), base_url)
+
+
+def _account_base_url(account: dict) -> str:
     base_url = (account.get("base_url") or "").strip()
     if not base_url:
         raise ValueError("FIB base URL is missing.")
+    return base_url
+
+
+def _cached_token(key: tuple[str, str, str]) -> str | None:
+    hit = _TOKEN_CACHE.get(key)
+    if hit and time.monotonic() < hit[1]:
+        return hit[0]
+    return None
 
+
+def _token_request(base_url: str, account: dict) -> tuple[str, dict, dict]:
     token_url = base_url.rstrip("/") + "/auth/realms/fib-online-shop/protocol/openid-connect/token"
     data = {
         "grant_type": "client_credentials",
         "client_id": account.get("client_id"),
         "client_secret": account.get("client_secret"),
     }
+    return token_url, data, {"Content-Type": "application/x-www-form-urlencoded"}
+
 
-    resp = httpx.post(token_url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"}, timeout=20)
+def _store_token(key: tuple[str, str, str], resp: httpx.Response) -> str:
     if resp.status_code != 200:
         raise ValueError(f"Token request failed ({resp.status_code}): {resp.text}")
     payload = resp.json()
     token = payload.get("access_token")
     if not token:
         raise ValueError("Missing access_token in FIB response.")
+    try:
+        expires_in = float(payload.get("expires_in") or 300)
+    except (TypeError, ValueError):
+        expires_in = 300.0
+    _TOKEN_CACHE[key] = (token, time.monotonic() + expires_in - TOKEN_EXPIRY_MARGIN_SEC)
     return token
 
 
-def create_payment(amount_iqd: int, description: str | None = None) -> dict:
-    account = _get_active_account()
-    token = _get_access_token(account)
+def _get_access_token(account: dict) -> str:
+    base_url = _account_base_url(account)
+    key = _token_cache_key(account, base_url)
+    token = _cached_token(key)
+    if token:
+        return token
 
-    base_url = (account.get("base_url") or "").strip()
-    pay_url = base_url.rstrip("/") + "/protected/v1/payments"
+    # One token fetch per account at a time; callers that queued behind it reuse its result.
+    with _TOKEN_LOCK:
+        lock = _TOKEN_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        token = _cached_token(key)
+        if token:
+            return token
+        url, data, headers = _token_request(base_url, account)
+        return _store_token(key, _get_client().post(url, data=data, headers=headers))
+
+
+async def _get_access_token_async(account: dict, http: httpx.AsyncClient) -> str:
+    base_url = _account_base_url(account)
+    key = _token_cache_key(account, base_url)
+    token = _cached_token(key)
+    if token:
+        return token
+
+    # No await between lookup and insert, so the event loop can't race the setdefault.
+    lock = _ASYNC_TOKEN_LOCKS.get(key)
+    if lock is None:
+        lock = _ASYNC_TOKEN_LOCKS.setdefault(key, asyncio.Lock())
+    async with lock:
+        token = _cached_token(key)
+        if token:
+            return token
+        url, data, headers = _token_request(base_url, account)
+        return _store_token(key, await http.post(url, data=data, headers=headers, timeout=REQUEST_TIMEOUT_SEC))
+
+
+def _payment_request(account: dict, amount_iqd: int, description: str | None) -> tuple[str, dict]:
+    pay_url = _account_base_url(account).rstrip("/") + "/protected/v1/payments"
 
     public_base = (os.getenv("PUBLIC_BASE_URL") or "http://127.0.0.1:8000").rstrip("/")
     redirect_uri = public_base + "/fib/return"
@@ -138,16 +278,20 @@ def create_payment(amount_iqd: int, description: str | None = None) -> dict:
         "category": "ECOMMERCE",
         "refundableFor": "PT48H",
     }
+    return pay_url, payload
 
-    resp = httpx.post(
-        pay_url,
-        json=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {token}",
-        },
-        timeout=20,
-    )
+
+def _payment_headers(token: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}",
+    }
+
+
+def _payment_result(account: dict, amount_iqd: int, payload: dict, resp: httpx.Response) -> dict:
+    if resp.status_code == 401:
+        # Token revoked or rotated early; drop it so the next call fetches a fresh one.
+        _TOKEN_CACHE.pop(_token_cache_key(account, _account_base_url(account)), None)
     if resp.status_code not in (200, 201):
         raise ValueError(f"Payment request failed ({resp.status_code}): {resp.text}")
 
@@ -165,7 +309,7 @@ def create_payment(amount_iqd: int, description: str | None = None) -> dict:
         "reference": ref,
         "amount": int(amount_iqd or 0),
         "currency": "IQD",
-        "description": desc,
+        "description": payload["description"],
         "account_id": account.get("id"),
         "account_label": account.get("label") or "",
         "payment_link": payment_link,
@@ -179,3 +323,27 @@ def create_payment(amount_iqd: int, description: str | None = None) -> dict:
             "corporate": data.get("corporateAppLink"),
         },
     }
+
+
+def create_payment(amount_iqd: int, description: str | None = None) -> dict:
+    account = _get_active_account()
+    token = _get_access_token(account)
+    pay_url, payload = _payment_request(account, amount_iqd, description)
+    resp = _get_client().post(pay_url, json=payload, headers=_payment_headers(token))
+    return _payment_result(account, amount_iqd, payload, resp)
+
+
+async def create_payment_async(
+    amount_iqd: int, description: str | None = None, http: httpx.AsyncClient | None = None
+) -> dict:
+    """Non-blocking create_payment for ASGI handlers; same request and result shape.
+
+    `http` is the caller's shared AsyncClient (the gateway's app.state.http); without one the
+    module-level client is used.
+    """
+    http = http or _get_async_client()
+    account = _get_active_account()
+    token = await _get_access_token_async(account, http)
+    pay_url, payload = _payment_request(account, amount_iqd, description)
+    resp = await http.post(pay_url, json=payload, headers=_payment_headers(token), timeout=REQUEST_TIMEOUT_SEC)
+    return _payment_result(account, amount_iqd, payload, resp)